@@ -0,0 +1,235 @@
+"""
+Offline API benchmark: throughput, latency percentiles and allocations
+
+Drives /api/generate, /api/history, /api/stats and /api/auth/status through
+the ASGI app against the in-process stand-ins from stubs.py (no network,
+MongoDB or credentials needed), one endpoint at a time at a fixed
+concurrency. Each endpoint is run twice: once for timing and once under
+tracemalloc for allocations, so tracing overhead does not skew latencies.
+
+Results can be saved as a JSON baseline and later runs compared against
+it; the exit status is 1 if any endpoint regressed beyond the tolerance.
+
+Usage:
+    python benchmarks/api_bench.py --save-baseline benchmarks/baseline.json
+    python benchmarks/api_bench.py --compare benchmarks/baseline.json --tolerance 0.25
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List
+
+import httpx
+
+from stubs import SESSION_ID, USER_EMAIL, install_stubs, store
+
+ENDPOINTS = ("generate", "history", "stats", "auth_status")
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of samples"""
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _requests(client: httpx.AsyncClient) -> Dict[str, Callable[[int], Awaitable[httpx.Response]]]:
+    """One request factory per endpoint, taking the request number"""
+    return {
+        # Distinct prompts with the cache off, so every call runs the full pipeline
+        "generate": lambda i: client.post("/api/generate", json={"prompt": f"Benchmark survey {i}", "use_cache": False}),
+        "history": lambda i: client.get("/api/history", params={"limit": 20}),
+        "stats": lambda i: client.get("/api/stats"),
+        "auth_status": lambda i: client.get("/api/auth/status")
+    }
+
+
+async def _drive(request: Callable[[int], Awaitable[httpx.Response]], total: int, concurrency: int) -> Dict[str, Any]:
+    """Issue `total` requests from `concurrency` workers; latencies in ms"""
+    latencies: List[float] = []
+    failures = 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal failures
+        for i in counter:
+            started = time.perf_counter()
+            response = await request(i)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                failures += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return {"latencies": latencies, "failures": failures, "elapsed": time.perf_counter() - started}
+
+
+async def _allocations(request: Callable[[int], Awaitable[httpx.Response]], total: int, concurrency: int) -> Dict[str, float]:
+    """Peak traced memory and net bytes retained per request"""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        await _drive(request, total, concurrency)
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+
+    retained = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    return {"alloc_peak_kb": peak / 1024, "retained_bytes_per_request": retained / total}
+
+
+async def run(
+    endpoints: List[str],
+    requests: int,
+    concurrency: int,
+    warmup: int,
+    seed_history: int,
+    gemini_latency: float,
+    forms_latency: float,
+    measure_allocations: bool
+) -> Dict[str, Dict[str, Any]]:
+    install_stubs(gemini_latency=gemini_latency, forms_latency=forms_latency)
+    store.seed(USER_EMAIL, seed_history)
+    from main import app
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport,
+        base_url="http://benchmark",
+        cookies={"session_id": SESSION_ID},
+        timeout=None
+    ) as client:
+        factories = _requests(client)
+        for endpoint in endpoints:
+            request = factories[endpoint]
+            await _drive(request, warmup, min(warmup, concurrency) or 1)
+
+            timing = await _drive(request, requests, concurrency)
+            latencies = timing["latencies"]
+            result = {
+                "requests": requests,
+                "failures": timing["failures"],
+                "throughput_rps": requests / timing["elapsed"],
+                "p50_ms": percentile(latencies, 50),
+                "p95_ms": percentile(latencies, 95),
+                "p99_ms": percentile(latencies, 99),
+                "max_ms": max(latencies)
+            }
+            if measure_allocations:
+                result.update(await _allocations(request, requests, concurrency))
+            results[endpoint] = result
+
+    return results
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], tolerance: float) -> List[str]:
+    """
+    Regressions of results against a baseline
+
+    An endpoint regresses if its p95 latency grew, or its throughput fell,
+    by more than `tolerance` (a fraction), or if it has failures.
+    """
+    regressions = []
+    for endpoint, result in results.items():
+        if result["failures"]:
+            regressions.append(f"{endpoint}: {result['failures']} failed requests")
+        previous = baseline.get(endpoint)
+        if not previous:
+            continue
+        if result["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{endpoint}: p95 {previous['p95_ms']:.2f} -> {result['p95_ms']:.2f} ms")
+        if result["throughput_rps"] < previous["throughput_rps"] * (1 - tolerance):
+            regressions.append(
+                f"{endpoint}: throughput {previous['throughput_rps']:.1f} -> {result['throughput_rps']:.1f} req/s"
+            )
+    return regressions
+
+
+def _print_results(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]]) -> None:
+    print("=" * 60)
+    print("API benchmark (stubbed backends)")
+    print("=" * 60)
+    for endpoint, result in results.items():
+        print(f"\n{endpoint}")
+        previous = baseline.get(endpoint, {})
+        for key, value in result.items():
+            line = f"{key:>28}: {value:.2f}" if isinstance(value, float) else f"{key:>28}: {value}"
+            if isinstance(previous.get(key), (int, float)) and previous[key]:
+                line += f"  ({(value - previous[key]) / previous[key]:+.0%} vs baseline)"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help="Comma-separated subset of: " + ", ".join(ENDPOINTS))
+    parser.add_argument("--requests", type=int, default=500, help="Measured requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--seed-history", type=int, default=1000, help="History entries to preload for the user")
+    parser.add_argument("--gemini-latency", type=float, default=0.01)
+    parser.add_argument("--forms-latency", type=float, default=0.005)
+    parser.add_argument("--no-allocations", action="store_true", help="Skip the tracemalloc pass")
+    parser.add_argument("--save-baseline", metavar="PATH", help="Write results as a JSON baseline")
+    parser.add_argument("--compare", metavar="PATH", help="Compare against a JSON baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p95/throughput change vs baseline")
+    args = parser.parse_args()
+
+    endpoints = [endpoint.strip() for endpoint in args.endpoints.split(",") if endpoint.strip()]
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+
+    config = {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "seed_history": args.seed_history,
+        "gemini_latency": args.gemini_latency,
+        "forms_latency": args.forms_latency
+    }
+    results = asyncio.run(run(
+        endpoints, args.requests, args.concurrency, args.warmup, args.seed_history,
+        args.gemini_latency, args.forms_latency, not args.no_allocations
+    ))
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            saved = json.load(f)
+        if saved.get("config") != config:
+            print(f"⚠️  Baseline was recorded with different settings: {saved.get('config')}")
+        baseline = saved["results"]
+
+    _print_results(results, baseline)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump({
+                "recorded_at": datetime.utcnow().isoformat(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "config": config,
+                "results": results
+            }, f, indent=2)
+        print(f"\nBaseline saved to {args.save_baseline}")
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print("\n❌ Regressions:")
+        for regression in regressions:
+            print(f"  - {regression}")
+        return 1
+    print("\n✓ No regressions" if args.compare else "\n✓ All requests succeeded")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
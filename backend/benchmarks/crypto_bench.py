@@ -0,0 +1,69 @@
+"""
+Micro-benchmark: token encrypt/decrypt throughput
+
+Compares the original per-call cipher construction with the cached
+MultiFernet cipher and the decrypted-secret cache in auth_service.
+
+Usage:
+    python benchmarks/crypto_bench.py --iterations 20000
+"""
+
+import argparse
+import base64
+import hashlib
+import os
+import sys
+import timeit
+
+# Add backend directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.fernet import Fernet
+from services import auth_service
+
+TOKEN = "ya29.benchmark-access-token-" + "x" * 180
+
+
+def _legacy_cipher():
+    key = base64.urlsafe_b64encode(hashlib.sha256(auth_service.SECRET_KEY.encode()).digest())
+    return Fernet(key)
+
+
+def legacy_encrypt(token):
+    return _legacy_cipher().encrypt(token.encode()).decode()
+
+
+def legacy_decrypt(encrypted_token):
+    return _legacy_cipher().decrypt(encrypted_token.encode()).decode()
+
+
+def measure(label, func, iterations):
+    seconds = timeit.timeit(func, number=iterations)
+    ops = iterations / seconds
+    print(f"{label:>34}: {ops:>12,.0f} ops/s  ({seconds / iterations * 1e6:.1f} µs/op)")
+    return ops
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+    n = args.iterations
+
+    ciphertext = legacy_encrypt(TOKEN)
+
+    print("=" * 60)
+    print("Token encryption throughput")
+    print("=" * 60)
+    measure("encrypt (before: cipher per call)", lambda: legacy_encrypt(TOKEN), n)
+    measure("encrypt (after: cached cipher)", lambda: auth_service.encrypt_token(TOKEN), n)
+    before = measure("decrypt (before: cipher per call)", lambda: legacy_decrypt(ciphertext), n)
+    auth_service._decrypt_cache.clear()
+    measure("decrypt (after: cold cache)", lambda: auth_service.get_cipher().decrypt(ciphertext.encode()), n)
+    after = measure("decrypt (after: warm cache)", lambda: auth_service.decrypt_token(ciphertext), n)
+    print(f"\nHot-path decrypt speedup: {after / before:.0f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,56 @@
+"""
+Benchmark: Google Forms client construction cost
+
+Compares building the Forms client with googleapiclient's build() on every
+request (the original GoogleFormService behaviour) with the cached
+discovery document and pooled transport in services.google_clients.
+
+Usage:
+    python benchmarks/discovery_bench.py --iterations 200
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+# Add backend directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+from services.google_form_service import GoogleFormService
+
+
+def legacy_client():
+    return build('forms', 'v1', credentials=Credentials(token="benchmark-access-token"))
+
+
+def cached_client():
+    return GoogleFormService("benchmark-access-token").service
+
+
+def measure(label, func, iterations):
+    seconds = timeit.timeit(func, number=iterations)
+    per_call_ms = seconds / iterations * 1000
+    print(f"{label:>32}: {per_call_ms:8.3f} ms/client")
+    return per_call_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Forms API client construction")
+    print("=" * 60)
+    before = measure("before: build() per request", legacy_client, args.iterations)
+    cached_client()  # Load the discovery document once, as the first request would
+    after = measure("after: cached discovery doc", cached_client, args.iterations)
+    print(f"\nSpeedup: {before / after:.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
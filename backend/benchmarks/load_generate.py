@@ -0,0 +1,94 @@
+"""
+Load test: latency of cheap endpoints while generations are in flight
+
+Fires N concurrent /api/generate calls against stubbed backends and
+measures /api/auth/status latency on the same worker meanwhile.
+
+Usage:
+    python benchmarks/load_generate.py --concurrency 50 --max-p99-ms 50
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+
+import httpx
+
+from stubs import SESSION_ID, install_stubs
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of samples"""
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def run(concurrency: int, probes: int, gemini_latency: float, forms_latency: float) -> dict:
+    install_stubs(gemini_latency=gemini_latency, forms_latency=forms_latency)
+    from main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport,
+        base_url="http://benchmark",
+        cookies={"session_id": SESSION_ID},
+        timeout=None
+    ) as client:
+        started = time.perf_counter()
+        generations = [
+            asyncio.create_task(client.post("/api/generate", json={"prompt": f"Survey {i}"}))
+            for i in range(concurrency)
+        ]
+
+        # Let the generations reach their blocking calls before probing
+        await asyncio.sleep(0.05)
+
+        latencies = []
+        for _ in range(probes):
+            probe_start = time.perf_counter()
+            response = await client.get("/api/auth/status")
+            latencies.append((time.perf_counter() - probe_start) * 1000)
+            assert response.json()["authenticated"], response.text
+
+        responses = await asyncio.gather(*generations)
+        elapsed = time.perf_counter() - started
+
+    failures = [r for r in responses if r.status_code != 200]
+    return {
+        "generations": concurrency,
+        "generation_failures": len(failures),
+        "generation_wall_s": elapsed,
+        "serial_estimate_s": concurrency * (gemini_latency + forms_latency),
+        "status_p50_ms": statistics.median(latencies),
+        "status_p99_ms": percentile(latencies, 99),
+        "status_max_ms": max(latencies)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--probes", type=int, default=200)
+    parser.add_argument("--gemini-latency", type=float, default=0.5)
+    parser.add_argument("--forms-latency", type=float, default=0.1)
+    parser.add_argument("--max-p99-ms", type=float, default=50.0)
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.concurrency, args.probes, args.gemini_latency, args.forms_latency))
+
+    print("=" * 60)
+    print("/api/auth/status under concurrent /api/generate load")
+    print("=" * 60)
+    for key, value in result.items():
+        print(f"{key:>22}: {value:.2f}" if isinstance(value, float) else f"{key:>22}: {value}")
+
+    passed = result["generation_failures"] == 0 and result["status_p99_ms"] <= args.max_p99_ms
+    print(f"\n{'✓' if passed else '❌'} p99 budget {args.max_p99_ms:.0f} ms")
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
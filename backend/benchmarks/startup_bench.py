@@ -0,0 +1,117 @@
+"""
+Cold-start check: import time of the app and time until it can serve
+
+Each run starts a fresh interpreter, imports main under -X importtime and
+runs the app's startup (lifespan) hook, which must not wait on MongoDB or
+any other network service. Reports the median import and startup times,
+the slowest modules imported directly by the app, and fails if the budget
+is exceeded or a lazily loaded SDK was imported at startup.
+
+Usage:
+    python benchmarks/startup_bench.py --runs 5 --max-startup-ms 1200
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child interpreter; the last stdout line is the JSON result
+CHILD = """
+import asyncio, json, sys, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+eager = [module for module in main.LAZY_SDK_MODULES if module in sys.modules]
+
+async def start():
+    async with main.app.router.lifespan_context(main.app):
+        return time.perf_counter()
+
+ready = asyncio.run(start())
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "startup_ms": (ready - started) * 1000,
+    "eager_sdks": eager
+}))
+"""
+
+
+def parse_importtime(stderr: str) -> List[Tuple[int, str, int]]:
+    """(depth, module, cumulative microseconds) for each -X importtime line"""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((depth, name.strip(), int(cumulative)))
+    return entries
+
+
+def direct_imports_of_main(entries: List[Tuple[int, str, int]]) -> Dict[str, int]:
+    """Cumulative import time of each module main imports itself"""
+    # importtime prints children before their parent, one level deeper
+    main_index = next(i for i, (_, name, _) in enumerate(entries) if name == "main")
+    main_depth = entries[main_index][0]
+    direct = {}
+    for depth, name, cumulative in reversed(entries[:main_index]):
+        if depth <= main_depth:
+            break
+        if depth == main_depth + 1:
+            direct[name] = cumulative
+    return direct
+
+
+def run_once() -> Tuple[Dict, Dict[str, int]]:
+    env = {**os.environ, "PREWARM_SDKS": "false", "PYTHONWARNINGS": "ignore"}
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    return result, direct_imports_of_main(parse_importtime(completed.stderr))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="Slowest direct imports to list")
+    parser.add_argument("--max-startup-ms", type=float, default=1200.0)
+    args = parser.parse_args()
+
+    results = []
+    for _ in range(args.runs):
+        result, direct = run_once()
+        results.append(result)
+
+    import_ms = statistics.median(result["import_ms"] for result in results)
+    startup_ms = statistics.median(result["startup_ms"] for result in results)
+    eager = sorted({module for result in results for module in result["eager_sdks"]})
+
+    print("=" * 60)
+    print(f"Cold start over {args.runs} runs (median)")
+    print("=" * 60)
+    print(f"{'import main':>22}: {import_ms:.1f} ms")
+    print(f"{'ready to serve':>22}: {startup_ms:.1f} ms")
+    print("\nSlowest imports (last run, -X importtime cumulative):")
+    for name, cumulative in sorted(direct.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{name:>30}: {cumulative / 1000:.1f} ms")
+
+    passed = True
+    if eager:
+        print(f"\n❌ Imported at startup but meant to be lazy: {', '.join(eager)}")
+        passed = False
+    if startup_ms > args.max_startup_ms:
+        passed = False
+    print(f"\n{'✓' if passed else '❌'} startup budget {args.max_startup_ms:.0f} ms")
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
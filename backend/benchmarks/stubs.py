@@ -0,0 +1,203 @@
+"""
+In-process stand-ins for MongoDB, Gemini and the Google Forms API
+
+Used by the benchmark scripts so the ASGI app can be driven end to end
+without network access or real credentials. Stubs keep the blocking
+behaviour of the real SDKs (time.sleep) so event-loop stalls show up.
+"""
+
+import json
+import os
+import re
+import sys
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+
+# Add backend directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Benchmarks measure our own overhead: drive every request through instead
+# of rate limiting one synthetic user
+os.environ.setdefault("RATE_LIMIT_BACKEND", "none")
+os.environ.setdefault("ADMISSION_CONCURRENCY", "1000")
+
+from models import FormSchema, FormQuestion
+from services.auth_service import encrypt_token
+
+SESSION_ID = "benchmark-session"
+USER_EMAIL = "benchmark@example.com"
+USER_STATS_FIELDS = ("forms", "prompt_tokens", "output_tokens", "latency_ms_total", "latency_samples")
+
+
+class InMemoryStore:
+    """
+    Form history and per-user counters held in process
+
+    Mirrors the query semantics of the database.py functions it replaces
+    (newest-first keyset paging, projection, title search, counters kept
+    up to date on save) so the routes do the same work as against MongoDB.
+    """
+
+    def __init__(self):
+        self.history: List[Dict[str, Any]] = []
+        self.user_stats: Dict[str, Dict[str, int]] = {}
+
+    def _insert(self, entries: List[Dict[str, Any]]) -> None:
+        created_at = datetime.utcnow()
+        for entry in entries:
+            metrics = entry.pop("metrics", None) or {}
+            self.history.append({"_id": ObjectId(), **entry, **metrics, "created_at": created_at})
+
+            stats = self.user_stats.setdefault(entry["user_email"], dict.fromkeys(USER_STATS_FIELDS, 0))
+            stats["forms"] += 1
+            stats["prompt_tokens"] += metrics.get("prompt_tokens") or 0
+            stats["output_tokens"] += metrics.get("output_tokens") or 0
+            if metrics.get("latency_ms") is not None:
+                stats["latency_ms_total"] += metrics["latency_ms"]
+                stats["latency_samples"] += 1
+
+    def seed(self, user_email: str, count: int) -> None:
+        """Add `count` history entries for a user"""
+        self._insert([
+            {
+                "user_email": user_email,
+                "form_id": f"seed-{i}",
+                "form_url": f"https://docs.google.com/forms/d/seed-{i}/edit",
+                "form_title": f"Seeded Form {i}",
+                "prompt": f"Seeded survey {i}",
+                "metrics": {"model": "stub-model", "prompt_tokens": 250, "output_tokens": 400, "latency_ms": 800}
+            }
+            for i in range(count)
+        ])
+
+    async def save_form_history(self, metrics: Optional[Dict[str, Any]] = None, **entry) -> None:
+        self._insert([{**entry, "metrics": metrics}])
+
+    async def save_form_history_many(self, entries: List[Dict[str, Any]]) -> None:
+        self._insert([dict(entry) for entry in entries])
+
+    async def get_form_history(
+        self,
+        user_email: str,
+        skip: int = 0,
+        limit: int = 20,
+        after: Optional[Tuple[datetime, ObjectId]] = None,
+        fields: Optional[List[str]] = None,
+        title_query: Optional[str] = None
+    ) -> list:
+        title_pattern = re.compile(re.escape(title_query), re.IGNORECASE) if title_query else None
+        # Entries are appended in (created_at, _id) order, so newest first is reversed
+        page = []
+        for record in reversed(self.history):
+            if len(page) == skip + limit:
+                break
+            if (
+                record["user_email"] == user_email
+                and (after is None or (record["created_at"], record["_id"]) < after)
+                and (title_pattern is None or title_pattern.search(record["form_title"]))
+            ):
+                page.append(record)
+        page = page[skip:]
+
+        keep = {"_id", "created_at", *fields} if fields else None
+        return [
+            {key: value for key, value in record.items() if keep is None or key in keep}
+            for record in page
+        ]
+
+    async def get_user_stats(self, user_email: str) -> Dict[str, Any]:
+        return dict(self.user_stats.get(user_email) or dict.fromkeys(USER_STATS_FIELDS, 0))
+
+
+# History written through the stubs, for inspection by benchmarks
+store = InMemoryStore()
+saved_history = store.history
+
+
+async def _fake_session(session_id):
+    if session_id != SESSION_ID:
+        return None
+    return {
+        "session_id": SESSION_ID,
+        "user_email": USER_EMAIL,
+        "created_at": datetime.utcnow(),
+        "expires_at": datetime.utcnow() + timedelta(hours=24)
+    }
+
+
+def install_stubs(gemini_latency: float = 0.5, forms_latency: float = 0.1) -> None:
+    """
+    Replace database and Google SDK calls used by the routes with stubs
+
+    Args:
+        gemini_latency: Seconds each schema generation blocks for
+        forms_latency: Seconds each form creation blocks for
+    """
+    import dependencies
+    from routes import history
+    from services import generation, schema_cache
+
+    token_doc = {
+        "user_email": USER_EMAIL,
+        "access_token": encrypt_token("benchmark-access-token"),
+        "refresh_token": encrypt_token("benchmark-refresh-token"),
+        "token_expiry": datetime.utcnow() + timedelta(days=1)
+    }
+
+    async def fake_get_oauth_token(user_email):
+        return token_doc
+
+    async def fake_get_user_settings(user_email):
+        return None
+
+    def fake_schema(prompt):
+        return FormSchema(
+            title="Benchmark Form",
+            description=prompt,
+            questions=[
+                FormQuestion(title="Name", question_type="TEXT"),
+                FormQuestion(title="Rating", question_type="MULTIPLE_CHOICE", options=["1", "2", "3"])
+            ]
+        )
+
+    def fake_usage(prompt, text):
+        return SimpleNamespace(prompt_token_count=len(prompt) // 4 + 200, candidates_token_count=len(text) // 4)
+
+    def fake_generate_form_schema(prompt, max_retries=None, api_key=None, policy=None, cancelled=None, usage=None):
+        time.sleep(gemini_latency)
+        form_schema = fake_schema(prompt)
+        if usage is not None:
+            usage.add("stub-model", fake_usage(prompt, form_schema.model_dump_json()))
+        return form_schema
+
+    def fake_stream_form_schema_text(prompt, api_key=None, usage=None):
+        text = json.dumps(fake_schema(prompt).model_dump())
+        chunk_size = max(1, len(text) // 10)
+        for start in range(0, len(text), chunk_size):
+            time.sleep(gemini_latency / 10)
+            yield text[start:start + chunk_size]
+        if usage is not None:
+            usage.add("stub-model", fake_usage(prompt, text))
+
+    class FakeGoogleFormService:
+        def __init__(self, access_token):
+            self.access_token = access_token
+
+        def create_form(self, form_schema):
+            time.sleep(forms_latency)
+            return "https://docs.google.com/forms/d/benchmark/edit", "benchmark"
+
+    dependencies.get_session = _fake_session
+    dependencies.get_oauth_token = fake_get_oauth_token
+    dependencies.get_user_settings = fake_get_user_settings
+    generation.save_form_history = store.save_form_history
+    generation.save_form_history_many = store.save_form_history_many
+    history.get_form_history = store.get_form_history
+    history.get_user_stats = store.get_user_stats
+    schema_cache.generate_form_schema = fake_generate_form_schema
+    schema_cache.stream_form_schema_text = fake_stream_form_schema_text
+    generation.GoogleFormService = FakeGoogleFormService
@@ -1,10 +1,15 @@
-from pymongo import MongoClient
-from pymongo.database import Database
-from pymongo.collection import Collection
+from bson import ObjectId
+from pymongo import AsyncMongoClient, ASCENDING, DESCENDING, IndexModel, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pymongo.asynchronous.database import AsyncDatabase
+from pymongo.asynchronous.collection import AsyncCollection
 import os
+import re
 from dotenv import load_dotenv
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
 from datetime import datetime, timedelta
+from cache import TTLCache
+from tracing import traced
 
 load_dotenv()
 
@@ -12,20 +17,49 @@ load_dotenv()
 MONGODB_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017/")
 DATABASE_NAME = "google_forms_creator"
 
+# Connection pool tuning (shared by all requests on this worker)
+MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", "100"))
+MONGODB_MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", "0"))
+MONGODB_MAX_IDLE_TIME_MS = int(os.getenv("MONGODB_MAX_IDLE_TIME_MS", "300000"))
+MONGODB_CONNECT_TIMEOUT_MS = int(os.getenv("MONGODB_CONNECT_TIMEOUT_MS", "5000"))
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGODB_SOCKET_TIMEOUT_MS = int(os.getenv("MONGODB_SOCKET_TIMEOUT_MS", "20000"))
+MONGODB_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGODB_WAIT_QUEUE_TIMEOUT_MS", "5000"))
+
+# In-process session cache (positive entries are also capped by the session's expires_at)
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "10000"))
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", "60"))
+SESSION_CACHE_NEGATIVE_TTL = float(os.getenv("SESSION_CACHE_NEGATIVE_TTL", "5"))
+
+# Attributes of the span around each database operation
+_DB_SPAN = {"db.system": "mongodb"}
+
+_NOT_CACHED = object()
+_session_cache = TTLCache(maxsize=SESSION_CACHE_SIZE, ttl=SESSION_CACHE_TTL)
+
 # Global MongoDB client
-_mongo_client: Optional[MongoClient] = None
-_database: Optional[Database] = None
+_mongo_client: Optional[AsyncMongoClient] = None
+_database: Optional[AsyncDatabase] = None
 
 
-def get_mongo_client() -> MongoClient:
+def get_mongo_client() -> AsyncMongoClient:
     """Get or create MongoDB client"""
     global _mongo_client
     if _mongo_client is None:
-        _mongo_client = MongoClient(MONGODB_URI)
+        _mongo_client = AsyncMongoClient(
+            MONGODB_URI,
+            maxPoolSize=MONGODB_MAX_POOL_SIZE,
+            minPoolSize=MONGODB_MIN_POOL_SIZE,
+            maxIdleTimeMS=MONGODB_MAX_IDLE_TIME_MS,
+            connectTimeoutMS=MONGODB_CONNECT_TIMEOUT_MS,
+            serverSelectionTimeoutMS=MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+            socketTimeoutMS=MONGODB_SOCKET_TIMEOUT_MS,
+            waitQueueTimeoutMS=MONGODB_WAIT_QUEUE_TIMEOUT_MS
+        )
     return _mongo_client
 
 
-def get_database() -> Database:
+def get_database() -> AsyncDatabase:
     """Get database instance"""
     global _database
     if _database is None:
@@ -34,15 +68,25 @@ def get_database() -> Database:
     return _database
 
 
-def get_collection(collection_name: str) -> Collection:
+def get_collection(collection_name: str) -> AsyncCollection:
     """Get a specific collection"""
     db = get_database()
     return db[collection_name]
 
 
+async def close_connection() -> None:
+    """Close the MongoDB client and its connection pool"""
+    global _mongo_client, _database
+    if _mongo_client is not None:
+        await _mongo_client.close()
+    _mongo_client = None
+    _database = None
+
+
 # ============ Session Management ============
 
-def create_session(user_email: str, session_id: str, expires_in_hours: int = 24) -> Dict[str, Any]:
+@traced(attributes=_DB_SPAN)
+async def create_session(user_email: str, session_id: str, expires_in_hours: int = 24) -> Dict[str, Any]:
     """Create a new user session"""
     sessions = get_collection("sessions")
     session_data = {
@@ -51,107 +95,602 @@ def create_session(user_email: str, session_id: str, expires_in_hours: int = 24)
         "created_at": datetime.utcnow(),
         "expires_at": datetime.utcnow() + timedelta(hours=expires_in_hours)
     }
-    sessions.insert_one(session_data)
+    await sessions.insert_one(session_data)
+    _cache_session(session_id, session_data)
     return session_data
 
 
-def get_session(session_id: str) -> Optional[Dict[str, Any]]:
-    """Retrieve a session by ID"""
+def _cache_session(session_id: str, session: Optional[Dict[str, Any]]) -> None:
+    """Cache a session until the earlier of the cache TTL and its own expiry"""
+    if session is None:
+        _session_cache.set(session_id, None, ttl=SESSION_CACHE_NEGATIVE_TTL)
+        return
+    remaining = (session["expires_at"] - datetime.utcnow()).total_seconds()
+    _session_cache.set(session_id, session, ttl=min(SESSION_CACHE_TTL, remaining))
+
+
+@traced(attributes=_DB_SPAN)
+async def get_session(session_id: str) -> Optional[Dict[str, Any]]:
+    """Retrieve a session by ID, served from the in-process cache when possible"""
+    cached = _session_cache.get(session_id, _NOT_CACHED)
+    if cached is not _NOT_CACHED:
+        return cached
+
     sessions = get_collection("sessions")
-    session = sessions.find_one({"session_id": session_id})
-    
-    if session and session["expires_at"] > datetime.utcnow():
-        return session
-    return None
+    session = await sessions.find_one({"session_id": session_id})
 
+    if not (session and session["expires_at"] > datetime.utcnow()):
+        session = None
+    _cache_session(session_id, session)
+    return session
 
-def delete_session(session_id: str) -> bool:
+
+@traced(attributes=_DB_SPAN)
+async def delete_session(session_id: str) -> bool:
     """Delete a session"""
+    _session_cache.pop(session_id)
     sessions = get_collection("sessions")
-    result = sessions.delete_one({"session_id": session_id})
+    result = await sessions.delete_one({"session_id": session_id})
+    # Drop again in case a concurrent lookup re-cached it mid-delete
+    _session_cache.pop(session_id)
     return result.deleted_count > 0
 
 
+def session_cache_stats() -> Dict[str, int]:
+    """Hit/miss counters of the session cache"""
+    return _session_cache.stats()
+
+
 # ============ OAuth Token Management ============
 
-def store_oauth_token(user_email: str, access_token: str, refresh_token: str, expires_in: int) -> None:
+@traced(attributes=_DB_SPAN)
+async def store_oauth_token(user_email: str, access_token: str, refresh_token: str, token_expiry: datetime) -> None:
     """Store or update OAuth tokens for a user"""
     tokens = get_collection("oauth_tokens")
     token_data = {
         "user_email": user_email,
         "access_token": access_token,
         "refresh_token": refresh_token,
-        "token_expiry": datetime.utcnow() + timedelta(seconds=expires_in),
+        "token_expiry": token_expiry,
         "created_at": datetime.utcnow()
     }
-    tokens.update_one(
+    await tokens.update_one(
         {"user_email": user_email},
         {"$set": token_data},
         upsert=True
     )
 
 
-def get_oauth_token(user_email: str) -> Optional[Dict[str, Any]]:
+@traced(attributes=_DB_SPAN)
+async def update_oauth_access_token(
+    user_email: str,
+    refresh_token: str,
+    access_token: str,
+    token_expiry: datetime,
+    new_refresh_token: Optional[str] = None
+) -> bool:
+    """
+    Save a refreshed access token, only if the user's tokens are unchanged
+
+    Never creates the document, so a refresh finishing after logout (or after
+    a new login replaced the refresh token) leaves the stored tokens alone.
+
+    Args:
+        refresh_token: Stored (encrypted) refresh token the refresh used
+        new_refresh_token: Replacement ciphertext for it (e.g. re-encrypted
+            under the current key), if any
+
+    Returns:
+        True if the stored tokens were updated
+    """
+    tokens = get_collection("oauth_tokens")
+    update = {"access_token": access_token, "token_expiry": token_expiry}
+    if new_refresh_token is not None:
+        update["refresh_token"] = new_refresh_token
+    result = await tokens.update_one(
+        {"user_email": user_email, "refresh_token": refresh_token},
+        {"$set": update}
+    )
+    return result.matched_count > 0
+
+
+@traced(attributes=_DB_SPAN)
+async def get_oauth_token(user_email: str) -> Optional[Dict[str, Any]]:
     """Retrieve OAuth tokens for a user"""
     tokens = get_collection("oauth_tokens")
-    return tokens.find_one({"user_email": user_email})
+    return await tokens.find_one({"user_email": user_email})
 
 
-def delete_oauth_token(user_email: str) -> bool:
+@traced(attributes=_DB_SPAN)
+async def delete_oauth_token(user_email: str) -> bool:
     """Delete OAuth tokens for a user"""
     tokens = get_collection("oauth_tokens")
-    result = tokens.delete_one({"user_email": user_email})
+    result = await tokens.delete_one({"user_email": user_email})
     return result.deleted_count > 0
 
 
 # ============ Form History Management ============
 
-def save_form_history(user_email: str, form_id: str, form_url: str, form_title: str, prompt: str) -> None:
-    """Save form generation to history"""
+@traced(attributes=_DB_SPAN)
+async def save_form_history(
+    user_email: str,
+    form_id: str,
+    form_url: str,
+    form_title: str,
+    prompt: str,
+    metrics: Optional[Dict[str, Any]] = None
+) -> None:
+    """
+    Save form generation to history
+
+    Args:
+        metrics: Generation details stored with the entry (model, prompt_tokens,
+            output_tokens, cached, latency_ms)
+    """
     history = get_collection("form_history")
     history_data = {
+        **(metrics or {}),
         "user_email": user_email,
         "form_id": form_id,
         "form_url": form_url,
         "form_title": form_title,
         "prompt": prompt,
-        "created_at": datetime.utcnow()
+        "created_at": datetime.utcnow(),
+        _COUNTED_FIELD: True
     }
-    history.insert_one(history_data)
+    await history.insert_one(history_data)
+    await _increment_user_stats(user_email, [history_data])
+
 
+@traced(attributes=_DB_SPAN)
+async def save_form_history_many(entries: List[Dict[str, Any]]) -> None:
+    """
+    Save several form generations to history in one round-trip
 
-def get_form_history(user_email: str, skip: int = 0, limit: int = 20) -> list:
-    """Retrieve form history for a user"""
+    If some entries fail to insert, the others are still saved and counted
+    in the user stats before the BulkWriteError is re-raised.
+    """
+    if not entries:
+        return
     history = get_collection("form_history")
-    cursor = history.find({"user_email": user_email}).sort("created_at", -1).skip(skip).limit(limit)
-    return list(cursor)
+    created_at = datetime.utcnow()
+    try:
+        await history.insert_many(
+            [{**entry, "created_at": created_at, _COUNTED_FIELD: True} for entry in entries],
+            ordered=False
+        )
+    except BulkWriteError as e:
+        failed = {error["index"] for error in e.details.get("writeErrors", [])}
+        await _increment_user_stats_by_user([entry for index, entry in enumerate(entries) if index not in failed])
+        raise
+    await _increment_user_stats_by_user(entries)
+
+
+async def _increment_user_stats_by_user(entries: List[Dict[str, Any]]) -> None:
+    by_user: Dict[str, List[Dict[str, Any]]] = {}
+    for entry in entries:
+        by_user.setdefault(entry["user_email"], []).append(entry)
+    for user_email, user_entries in by_user.items():
+        await _increment_user_stats(user_email, user_entries)
+
+
+# Newest first; _id breaks ties between entries saved in the same batch
+FORM_HISTORY_SORT = [("created_at", DESCENDING), ("_id", DESCENDING)]
+
+
+def _form_history_filter(
+    user_email: str,
+    after: Optional[Tuple[datetime, ObjectId]] = None,
+    title_query: Optional[str] = None
+) -> Dict[str, Any]:
+    query: Dict[str, Any] = {"user_email": user_email}
+    if after is not None:
+        created_at, entry_id = after
+        query["$or"] = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": entry_id}}
+        ]
+    if title_query:
+        query["form_title"] = {"$regex": re.escape(title_query), "$options": "i"}
+    return query
+
+
+@traced(attributes=_DB_SPAN)
+async def get_form_history(
+    user_email: str,
+    skip: int = 0,
+    limit: int = 20,
+    after: Optional[Tuple[datetime, ObjectId]] = None,
+    fields: Optional[List[str]] = None,
+    title_query: Optional[str] = None
+) -> list:
+    """
+    Retrieve form history for a user, newest first
+    
+    Args:
+        skip: Records to skip (offset paging; prefer `after`)
+        limit: Maximum number of records to return
+        after: (created_at, _id) of the last record of the previous page;
+            keyset paging costs the same at any depth
+        fields: Fields to return (_id and created_at are always included)
+        title_query: Case-insensitive substring to match in the form title
+    """
+    history = get_collection("form_history")
+    projection = {field: 1 for field in ["created_at", *fields]} if fields else {_COUNTED_FIELD: 0}
+    cursor = history.find(_form_history_filter(user_email, after, title_query), projection)
+    cursor = cursor.sort(FORM_HISTORY_SORT).skip(skip).limit(limit)
+    return await cursor.to_list()
+
+
+# ============ User Stats ============
+
+# Per-user totals kept in user_stats so /api/stats is one document read
+# regardless of history size
+_USER_STATS_FIELDS = ("forms", "prompt_tokens", "output_tokens", "latency_ms_total", "latency_samples")
+# Set on history entries whose totals went into user_stats by increment;
+# entries without it predate the counters and are added by the backfill
+_COUNTED_FIELD = "in_user_stats"
+
+
+@traced(attributes=_DB_SPAN)
+async def _increment_user_stats(user_email: str, entries: List[Dict[str, Any]]) -> None:
+    """
+    Add new history entries (saved with _COUNTED_FIELD set) to the user's counters
+
+    Always applied, creating the counters if needed, so an entry is never
+    lost to a backfill running at the same time; the backfill skips entries
+    counted here.
+    """
+    latencies = [entry["latency_ms"] for entry in entries if entry.get("latency_ms") is not None]
+    await get_collection("user_stats").update_one(
+        {"_id": user_email},
+        {"$inc": {
+            "forms": len(entries),
+            "prompt_tokens": sum(entry.get("prompt_tokens", 0) for entry in entries),
+            "output_tokens": sum(entry.get("output_tokens", 0) for entry in entries),
+            "latency_ms_total": sum(latencies),
+            "latency_samples": len(latencies)
+        }},
+        upsert=True
+    )
+
+
+@traced(attributes=_DB_SPAN)
+async def get_user_stats(user_email: str) -> Dict[str, Any]:
+    """
+    Usage totals for a user: forms, prompt/output tokens and latency sum/count
+
+    Served from the user's counters. The first call for a user adds, once,
+    the history entries saved before counters existed (those without
+    _COUNTED_FIELD), aggregated over the user_email index.
+    """
+    stats = get_collection("user_stats")
+    counters = await stats.find_one({"_id": user_email})
+    if counters and counters.get("backfilled"):
+        return {field: counters.get(field, 0) for field in _USER_STATS_FIELDS}
+
+    pipeline = [
+        {"$match": {"user_email": user_email, _COUNTED_FIELD: {"$ne": True}}},
+        {"$group": {
+            "_id": None,
+            "forms": {"$sum": 1},
+            "prompt_tokens": {"$sum": {"$ifNull": ["$prompt_tokens", 0]}},
+            "output_tokens": {"$sum": {"$ifNull": ["$output_tokens", 0]}},
+            "latency_ms_total": {"$sum": {"$ifNull": ["$latency_ms", 0]}},
+            "latency_samples": {"$sum": {"$cond": [{"$isNumber": "$latency_ms"}, 1, 0]}}
+        }}
+    ]
+    cursor = await get_collection("form_history").aggregate(pipeline)
+    totals = next(iter(await cursor.to_list()), {})
+    totals = {field: totals.get(field, 0) for field in _USER_STATS_FIELDS}
+
+    # Added on top of concurrent increments, and only by the first backfill
+    try:
+        counters = await stats.find_one_and_update(
+            {"_id": user_email, "backfilled": {"$ne": True}},
+            {"$inc": totals, "$set": {"backfilled": True}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # Another request finished the backfill first
+        counters = await stats.find_one({"_id": user_email})
+    return {field: counters.get(field, 0) for field in _USER_STATS_FIELDS}
+
+
+# ============ Schema Cache ============
+
+@traced(attributes=_DB_SPAN)
+async def get_cached_schema(cache_key: str) -> Optional[Dict[str, Any]]:
+    """Retrieve a cached form schema by its content hash"""
+    cache = get_collection("schema_cache")
+    entry = await cache.find_one({"_id": cache_key, "expires_at": {"$gt": datetime.utcnow()}})
+    return entry["schema"] if entry else None
+
+
+@traced(attributes=_DB_SPAN)
+async def save_cached_schema(cache_key: str, schema: Dict[str, Any], ttl_seconds: float) -> None:
+    """Store a form schema under its content hash"""
+    cache = get_collection("schema_cache")
+    await cache.update_one(
+        {"_id": cache_key},
+        {"$set": {
+            "schema": schema,
+            "created_at": datetime.utcnow(),
+            "expires_at": datetime.utcnow() + timedelta(seconds=ttl_seconds)
+        }},
+        upsert=True
+    )
+
+
+# ============ Rate Limits ============
+
+@traced(attributes=_DB_SPAN)
+async def consume_rate_limit_token(key: str, rate: float, burst: float, cost: float = 1) -> Tuple[bool, float]:
+    """
+    Atomically refill a token bucket and take `cost` tokens from it if available
+
+    The refill and the take run as one pipeline update on the bucket
+    document, so concurrent workers never oversubscribe a bucket. A cost
+    above the burst is allowed from a full bucket, leaving it negative.
+
+    Args:
+        key: Bucket identifier
+        rate: Refill rate in tokens per second
+        burst: Bucket capacity
+        cost: Tokens this request needs
+
+    Returns:
+        (allowed, tokens left after the request)
+    """
+    buckets = get_collection("rate_limits")
+    now = datetime.utcnow()
+    elapsed = {"$divide": [{"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}, 1000]}
+    refilled = {"$min": [burst, {"$add": [{"$ifNull": ["$tokens", burst]}, {"$multiply": [elapsed, rate]}]}]}
+    bucket = await buckets.find_one_and_update(
+        {"_id": key},
+        [
+            {"$set": {"tokens": refilled, "updated_at": now}},
+            {"$set": {"allowed": {"$gte": ["$tokens", min(cost, burst)]}}},
+            {"$set": {
+                "tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", cost]}, "$tokens"]},
+                # An idle bucket is full again after burst / rate seconds
+                "expires_at": now + timedelta(seconds=burst / rate + 60)
+            }}
+        ],
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return bucket["allowed"], bucket["tokens"]
+
+
+@traced(attributes=_DB_SPAN)
+async def refund_rate_limit_token(key: str, burst: float, cost: float = 1) -> None:
+    """Give `cost` tokens back to an existing bucket, up to its capacity"""
+    buckets = get_collection("rate_limits")
+    await buckets.update_one(
+        {"_id": key},
+        [{"$set": {"tokens": {"$min": [burst, {"$add": ["$tokens", cost]}]}}}]
+    )
+
+
+# ============ Generation Jobs ============
+
+@traced(attributes=_DB_SPAN)
+async def create_job(job_id: str, user_email: str, prompt: str, use_cache: bool, retention_hours: int = 168) -> Dict[str, Any]:
+    """Create a queued generation job"""
+    jobs = get_collection("generation_jobs")
+    job_data = {
+        "_id": job_id,
+        "user_email": user_email,
+        "prompt": prompt,
+        "use_cache": use_cache,
+        "status": "queued",
+        "attempts": 0,
+        "result": None,
+        "error": None,
+        "created_at": datetime.utcnow(),
+        "updated_at": datetime.utcnow(),
+        "expires_at": datetime.utcnow() + timedelta(hours=retention_hours)
+    }
+    await jobs.insert_one(job_data)
+    return job_data
+
+
+@traced(attributes=_DB_SPAN)
+async def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """Retrieve a generation job by ID"""
+    jobs = get_collection("generation_jobs")
+    return await jobs.find_one({"_id": job_id})
+
+
+def _claimable_filter() -> Dict[str, Any]:
+    """Jobs that are queued, or running under a lease that has expired (worker died)"""
+    return {"$or": [
+        {"status": "queued"},
+        {"status": "running", "lease_expires_at": {"$lt": datetime.utcnow()}}
+    ]}
+
+
+@traced(attributes=_DB_SPAN)
+async def claim_job(job_id: str, lease_seconds: float) -> Optional[Dict[str, Any]]:
+    """Atomically mark a job as running under a lease; None if another worker has it"""
+    jobs = get_collection("generation_jobs")
+    return await jobs.find_one_and_update(
+        {"_id": job_id, **_claimable_filter()},
+        {
+            "$set": {
+                "status": "running",
+                "lease_expires_at": datetime.utcnow() + timedelta(seconds=lease_seconds),
+                "updated_at": datetime.utcnow()
+            },
+            "$inc": {"attempts": 1}
+        },
+        return_document=ReturnDocument.AFTER
+    )
+
+
+@traced(attributes=_DB_SPAN)
+async def finish_job(job_id: str, status: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> None:
+    """Record the outcome of a generation job"""
+    jobs = get_collection("generation_jobs")
+    await jobs.update_one(
+        {"_id": job_id},
+        {"$set": {"status": status, "result": result, "error": error, "updated_at": datetime.utcnow()}}
+    )
+
+
+@traced(attributes=_DB_SPAN)
+async def release_job(job_id: str, lease_expires_at: datetime) -> bool:
+    """
+    Put a job this worker claimed back in the queue, e.g. on shutdown
+
+    Only applies while the lease is still the one from claim_job, and does
+    not count the interrupted run as an attempt.
+
+    Returns:
+        True if the job was released
+    """
+    jobs = get_collection("generation_jobs")
+    result = await jobs.update_one(
+        {"_id": job_id, "status": "running", "lease_expires_at": lease_expires_at},
+        {
+            "$set": {"status": "queued", "updated_at": datetime.utcnow()},
+            "$unset": {"lease_expires_at": ""},
+            "$inc": {"attempts": -1}
+        }
+    )
+    return result.modified_count > 0
+
+
+@traced(attributes=_DB_SPAN)
+async def get_claimable_job_ids(limit: int) -> List[str]:
+    """IDs of jobs waiting to be (re)run, oldest first"""
+    jobs = get_collection("generation_jobs")
+    cursor = jobs.find(_claimable_filter(), {"_id": 1}).sort("created_at", 1).limit(limit)
+    return [job["_id"] for job in await cursor.to_list()]
 
 
 # ============ Database Initialization ============
 
-def verify_connection() -> bool:
+@traced(attributes=_DB_SPAN)
+async def ping_database() -> None:
+    """Round-trip to MongoDB; raises if the server cannot be reached"""
+    await get_mongo_client().admin.command("ping")
+
+
+async def verify_connection() -> bool:
     """Verify MongoDB connection"""
     try:
-        client = get_mongo_client()
-        client.server_info()  # Will raise exception if cannot connect
+        await ping_database()
         return True
     except Exception as e:
         print(f"MongoDB connection failed: {e}")
         return False
 
 
+# ============ Index Bootstrap ============
+
+# Indexes backing every hot query; sessions expire through the TTL monitor
+INDEXES: Dict[str, List[IndexModel]] = {
+    "sessions": [
+        IndexModel([("session_id", ASCENDING)], unique=True, name="session_id_unique"),
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0, name="expires_at_ttl")
+    ],
+    "oauth_tokens": [
+        IndexModel([("user_email", ASCENDING)], unique=True, name="user_email_unique")
+    ],
+    "user_settings": [
+        IndexModel([("user_email", ASCENDING)], unique=True, name="user_email_unique")
+    ],
+    "form_history": [
+        # Serves keyset paging, and title search on index keys without fetching documents
+        IndexModel(
+            [("user_email", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING), ("form_title", ASCENDING)],
+            name="user_email_created_at_id_title"
+        )
+    ],
+    "schema_cache": [
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0, name="expires_at_ttl")
+    ],
+    "rate_limits": [
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0, name="expires_at_ttl")
+    ],
+    "generation_jobs": [
+        IndexModel([("status", ASCENDING), ("lease_expires_at", ASCENDING)], name="status_lease"),
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0, name="expires_at_ttl")
+    ]
+}
+
+
+@traced(attributes=_DB_SPAN)
+async def ensure_indexes() -> None:
+    """Create any missing indexes (idempotent, safe to run on every startup)"""
+    for collection_name, indexes in INDEXES.items():
+        await get_collection(collection_name).create_indexes(indexes)
+
+
+def _plan_stages(plan: Dict[str, Any]) -> List[str]:
+    """Flatten the stage names of an explain() query plan"""
+    stages = [plan["stage"]] if "stage" in plan else []
+    for key in ("queryPlan", "inputStage"):
+        if key in plan:
+            stages.extend(_plan_stages(plan[key]))
+    for child in plan.get("inputStages", []):
+        stages.extend(_plan_stages(child))
+    return stages
+
+
+@traced(attributes=_DB_SPAN)
+async def explain_hot_queries() -> Dict[str, List[str]]:
+    """
+    Explain the hot queries issued by this module
+    
+    Returns:
+        Mapping of query name to the stages of its winning plan
+    """
+    probe = "explain@example.com"
+    cursors = {
+        "get_session": get_collection("sessions").find({"session_id": "explain"}).limit(1),
+        "get_oauth_token": get_collection("oauth_tokens").find({"user_email": probe}).limit(1),
+        "get_user_settings": get_collection("user_settings").find({"user_email": probe}).limit(1),
+        "get_form_history": get_collection("form_history").find(
+            _form_history_filter(probe, after=(datetime.utcnow(), ObjectId()), title_query="survey")
+        ).sort(FORM_HISTORY_SORT).limit(20)
+    }
+    
+    plans = {}
+    for name, cursor in cursors.items():
+        explanation = await cursor.explain()
+        plans[name] = _plan_stages(explanation["queryPlanner"]["winningPlan"])
+    return plans
+
+
 # ============ User Settings Management ============
 
-def get_user_settings(user_email: str) -> Optional[Dict[str, Any]]:
+@traced(attributes=_DB_SPAN)
+async def get_user_settings(user_email: str) -> Optional[Dict[str, Any]]:
     """Retrieve user settings"""
     settings = get_collection("user_settings")
-    return settings.find_one({"user_email": user_email})
+    return await settings.find_one({"user_email": user_email})
+
+
+@traced(attributes=_DB_SPAN)
+async def replace_user_setting(user_email: str, key: str, old_value: Any, new_value: Any) -> bool:
+    """Change a setting only if it still holds old_value; True if it did"""
+    settings = get_collection("user_settings")
+    result = await settings.update_one(
+        {"user_email": user_email, key: old_value},
+        {"$set": {key: new_value, "updated_at": datetime.utcnow()}}
+    )
+    return result.matched_count > 0
 
 
-def update_user_setting(user_email: str, key: str, value: Any) -> None:
+@traced(attributes=_DB_SPAN)
+async def update_user_setting(user_email: str, key: str, value: Any) -> None:
     """Update a specific user setting"""
     settings = get_collection("user_settings")
-    settings.update_one(
+    await settings.update_one(
         {"user_email": user_email},
         {"$set": {key: value, "updated_at": datetime.utcnow()}},
         upsert=True
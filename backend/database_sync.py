@@ -0,0 +1,75 @@
+"""
+Synchronous facade over the async data layer in database.py
+
+For scripts such as test_generation.py that run outside the FastAPI event
+loop. Each call is executed on a private background event loop, which owns
+its own MongoDB client. Do not mix this facade with the async functions in
+the same process.
+"""
+
+import asyncio
+import atexit
+import functools
+import threading
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+import database
+
+T = TypeVar("T")
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    """Get or start the background event loop"""
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="database-sync", daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def run(coro: Awaitable[T]) -> T:
+    """Run a coroutine on the background loop and wait for its result"""
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop()).result()
+
+
+def _sync(func: Callable[..., Awaitable[T]]) -> Callable[..., T]:
+    @functools.wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> T:
+        return run(func(*args, **kwargs))
+    return wrapper
+
+
+@atexit.register
+def _shutdown() -> None:
+    if _loop is not None:
+        run(database.close_connection())
+        _loop.call_soon_threadsafe(_loop.stop)
+
+
+create_session = _sync(database.create_session)
+get_session = _sync(database.get_session)
+delete_session = _sync(database.delete_session)
+store_oauth_token = _sync(database.store_oauth_token)
+update_oauth_access_token = _sync(database.update_oauth_access_token)
+get_oauth_token = _sync(database.get_oauth_token)
+delete_oauth_token = _sync(database.delete_oauth_token)
+save_form_history = _sync(database.save_form_history)
+save_form_history_many = _sync(database.save_form_history_many)
+get_form_history = _sync(database.get_form_history)
+get_user_stats = _sync(database.get_user_stats)
+verify_connection = _sync(database.verify_connection)
+ensure_indexes = _sync(database.ensure_indexes)
+explain_hot_queries = _sync(database.explain_hot_queries)
+get_cached_schema = _sync(database.get_cached_schema)
+save_cached_schema = _sync(database.save_cached_schema)
+consume_rate_limit_token = _sync(database.consume_rate_limit_token)
+refund_rate_limit_token = _sync(database.refund_rate_limit_token)
+get_user_settings = _sync(database.get_user_settings)
+update_user_setting = _sync(database.update_user_setting)
+replace_user_setting = _sync(database.replace_user_setting)
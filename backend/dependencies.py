@@ -0,0 +1,110 @@
+import asyncio
+from functools import cached_property
+from typing import Any, Dict, Optional
+from fastapi import Depends, HTTPException, Request
+from database import get_session, get_oauth_token, get_user_settings, replace_user_setting
+from metrics import timed
+from services.auth_service import decrypt_token, rotate_token
+from services.token_manager import token_manager
+
+
+async def get_optional_session(request: Request) -> Optional[Dict[str, Any]]:
+    """Dependency returning the session for the request cookie, or None"""
+    session_id = request.cookies.get("session_id")
+
+    if not session_id:
+        return None
+
+    return await timed("session_lookup", get_session(session_id))
+
+
+async def get_current_session(request: Request) -> Dict[str, Any]:
+    """Dependency to get the current session, raising 401 if there is none"""
+    session_id = request.cookies.get("session_id")
+
+    if not session_id:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+
+    session = await timed("session_lookup", get_session(session_id))
+
+    if not session:
+        raise HTTPException(status_code=401, detail="Invalid or expired session")
+
+    return session
+
+
+async def get_current_user(session: Dict[str, Any] = Depends(get_current_session)) -> str:
+    """Dependency to get current authenticated user"""
+    return session["user_email"]
+
+
+class UserContext:
+    """
+    Session, OAuth token and settings of the current user, loaded once per request
+
+    Decrypted values are memoized so each secret is decrypted at most once,
+    and access tokens are served by the token manager.
+    """
+
+    def __init__(self, session: Dict[str, Any], token: Dict[str, Any], settings: Optional[Dict[str, Any]]):
+        self.session = session
+        self.token = token
+        self.settings = settings or {}
+
+    @property
+    def user_email(self) -> str:
+        return self.session["user_email"]
+
+    async def get_access_token(self) -> str:
+        """Valid access token, refreshed only if it has already expired"""
+        return await token_manager.get_access_token(self.user_email, self.token)
+
+    @cached_property
+    def gemini_api_key(self) -> Optional[str]:
+        """User's own Gemini key, or None to use the default"""
+        if "gemini_api_key" not in self.settings:
+            return None
+        try:
+            return decrypt_token(self.settings["gemini_api_key"])
+        except Exception:
+            print("Failed to decrypt user API key, falling back to default")
+            return None
+
+
+async def _rotate_gemini_key(user_email: str, settings: Optional[Dict[str, Any]]) -> None:
+    """Re-encrypt a stored Gemini key still under a previous SECRET_KEY"""
+    encrypted_key = (settings or {}).get("gemini_api_key")
+    if not encrypted_key:
+        return
+    try:
+        rotated_key = rotate_token(encrypted_key)
+        if rotated_key != encrypted_key:
+            await replace_user_setting(user_email, "gemini_api_key", encrypted_key, rotated_key)
+            settings["gemini_api_key"] = rotated_key
+    except Exception as e:
+        print(f"Re-encrypting Gemini key failed for {user_email}: {e}")
+
+
+async def load_user_context(session: Dict[str, Any]) -> Optional[UserContext]:
+    """Load token and settings for a session's user in parallel (None if no token is stored)"""
+    user_email = session["user_email"]
+    token, settings = await asyncio.gather(
+        timed("token_fetch", get_oauth_token(user_email)),
+        timed("settings_fetch", get_user_settings(user_email))
+    )
+
+    if not token:
+        return None
+
+    await _rotate_gemini_key(user_email, settings)
+    return UserContext(session, token, settings)
+
+
+async def get_user_context(session: Dict[str, Any] = Depends(get_current_session)) -> UserContext:
+    """Dependency loading token and settings for the current user in parallel"""
+    user = await load_user_context(session)
+
+    if not user:
+        raise HTTPException(status_code=401, detail="No OAuth token found. Please re-authenticate.")
+
+    return user
@@ -0,0 +1,118 @@
+import asyncio
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Number of threads available to blocking SDK calls (Gemini, Google APIs, token refresh)
+GENERATION_WORKERS = int(os.getenv("GENERATION_WORKERS", "32"))
+
+# Global executor
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+_in_flight = 0
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Get or create the bounded executor used for blocking calls"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=GENERATION_WORKERS,
+                    thread_name_prefix="generation"
+                )
+    return _executor
+
+
+async def run_blocking(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Run a blocking function on the executor without blocking the event loop
+
+    The caller's context variables are visible to func (as with
+    asyncio.to_thread), so per-request state such as stage timings follows
+    the call onto the worker thread.
+
+    Args:
+        func: Synchronous callable to run
+        *args, **kwargs: Arguments forwarded to func
+
+    Returns:
+        The return value of func
+    """
+    global _in_flight
+    loop = asyncio.get_running_loop()
+    _in_flight += 1
+    try:
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(get_executor(), partial(context.run, func, *args, **kwargs))
+    finally:
+        _in_flight -= 1
+
+
+async def iterate_blocking(func: Callable[..., Iterable[T]], *args: Any, **kwargs: Any) -> AsyncIterator[T]:
+    """
+    Consume a blocking iterator on the executor, yielding items as they arrive
+
+    If the consumer stops early (e.g. the client disconnects), the producer
+    thread stops at the next item.
+
+    Args:
+        func: Synchronous callable returning an iterable
+        *args, **kwargs: Arguments forwarded to func
+    """
+    global _in_flight
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    stopped = threading.Event()
+    done = object()
+
+    def produce() -> None:
+        try:
+            for item in func(*args, **kwargs):
+                if stopped.is_set():
+                    return
+                loop.call_soon_threadsafe(queue.put_nowait, (item, None))
+            loop.call_soon_threadsafe(queue.put_nowait, (done, None))
+        except BaseException as e:
+            loop.call_soon_threadsafe(queue.put_nowait, (done, e))
+
+    _in_flight += 1
+    future = loop.run_in_executor(get_executor(), contextvars.copy_context().run, produce)
+    future.add_done_callback(lambda _: _decrement_in_flight())
+    try:
+        while True:
+            item, error = await queue.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stopped.set()
+
+
+def _decrement_in_flight() -> None:
+    global _in_flight
+    _in_flight -= 1
+
+
+def executor_stats() -> Dict[str, int]:
+    """Current executor size and number of in-flight calls"""
+    return {
+        "workers": GENERATION_WORKERS,
+        "in_flight": _in_flight
+    }
+
+
+def shutdown_executor() -> None:
+    """Shut down the executor, waiting for running calls to finish"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
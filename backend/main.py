@@ -1,14 +1,89 @@
-from fastapi import FastAPI
+import asyncio
+import importlib
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
-from routes import auth, generate, history, settings
-from database import verify_connection
+from routes import auth, generate, history, jobs, settings
+from database import get_mongo_client, ensure_indexes, close_connection, session_cache_stats
+from executor import executor_stats, run_blocking, shutdown_executor
+from metrics import ServerTimingMiddleware, bind_gauges, render_metrics
+from tracing import setup_tracing, shutdown_tracing
+from services.token_manager import token_manager
+from services.circuit_breaker import breaker_stats
+from services.gemini_service import model_pool_stats, parse_stats
+from services.health import health_checker
+from services.model_router import model_stats
+from services.rate_limiter import admission
+from services.schema_cache import schema_cache
+from services.job_queue import job_queue
 import uvicorn
 import os
 
+# Google SDKs are imported where first used; unless disabled, they are
+# imported on the executor once the server is accepting requests
+PREWARM_SDKS = os.getenv("PREWARM_SDKS", "true").lower() == "true"
+LAZY_SDK_MODULES = (
+    "google.generativeai",
+    "google.ai.generativelanguage",
+    "google.api_core.exceptions",
+    "google.oauth2.credentials",
+    "google_auth_oauthlib.flow",
+    "google_auth_httplib2",
+    "googleapiclient.discovery",
+)
+
+
+def prewarm_sdks() -> None:
+    """Import the lazily loaded SDKs so the first request does not pay for them"""
+    for module in LAZY_SDK_MODULES:
+        try:
+            importlib.import_module(module)
+        except Exception as e:
+            print(f"✗ Pre-warming {module} failed: {e}")
+
+
+async def prepare_database() -> None:
+    """Create indexes as soon as the health checker first reaches MongoDB"""
+    await health_checker.mongo_ready.wait()
+    try:
+        await ensure_indexes()
+        print("✓ MongoDB indexes ready")
+    except Exception as e:
+        print(f"✗ MongoDB index creation failed: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Open the MongoDB pool on startup and release resources on shutdown
+
+    Startup does not wait for MongoDB: the health checker pings it in the
+    background and /readyz stays 503 until it answers.
+    """
+    get_mongo_client()
+    checker = asyncio.create_task(health_checker.run())
+    indexes = asyncio.create_task(prepare_database())
+    refresher = asyncio.create_task(token_manager.run_refresher())
+    await job_queue.start()
+    # Held so the task is not garbage collected before it finishes
+    prewarm = asyncio.create_task(run_blocking(prewarm_sdks)) if PREWARM_SDKS else None
+
+    yield
+
+    await job_queue.stop()
+    refresher.cancel()
+    indexes.cancel()
+    checker.cancel()
+    await close_connection()
+    shutdown_executor()
+    shutdown_tracing()
+
+
 app = FastAPI(
     title="One-Prompt Google Form Creator API",
     description="Generate Google Forms from natural language prompts using AI",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -23,24 +98,23 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Server-Timing"],
 )
+# Per-stage timings of each request, readable in the browser's network panel
+app.add_middleware(ServerTimingMiddleware)
+# Request spans wrap the other middleware (no-op unless TRACING_ENABLED)
+setup_tracing(app)
+
+bind_gauges(lambda: executor_stats()["in_flight"], admission.stats)
 
 # Include routers
 app.include_router(auth.router)
 app.include_router(generate.router)
 app.include_router(history.router)
+app.include_router(jobs.router)
 app.include_router(settings.router)
 
 
-@app.on_event("startup")
-async def startup_event():
-    """Verify MongoDB connection on startup"""
-    if verify_connection():
-        print("✓ MongoDB connection successful")
-    else:
-        print("✗ MongoDB connection failed - please check your MongoDB installation")
-
-
 @app.get("/")
 async def root():
     """Health check endpoint"""
@@ -51,17 +125,51 @@ async def root():
     }
 
 
+@app.get("/livez", include_in_schema=False)
+async def livez():
+    """Liveness probe: the worker is up and its event loop is serving requests"""
+    return Response(content=b'{"status":"alive"}', media_type="application/json")
+
+
+@app.get("/readyz", include_in_schema=False)
+async def readyz():
+    """
+    Readiness probe, served from the background health checker's snapshot
+
+    503 while MongoDB is unreachable, the executor is saturated, or the
+    snapshot has gone stale.
+    """
+    ready, body = health_checker.readiness()
+    return Response(content=body, status_code=200 if ready else 503, media_type="application/json")
+
+
 @app.get("/health")
 async def health():
-    """Detailed health check"""
-    mongo_status = verify_connection()
+    """Detailed health check (MongoDB status from the last background check)"""
+    mongo_status = health_checker.mongo_status()
     
     return {
         "api": "healthy",
-        "mongodb": "connected" if mongo_status else "disconnected"
+        "mongodb": {True: "connected", False: "disconnected"}.get(mongo_status, "unknown"),
+        "session_cache": session_cache_stats(),
+        "schema_cache": schema_cache.stats(),
+        "schema_parse": parse_stats(),
+        "model_pool": model_pool_stats(),
+        "oauth_tokens": token_manager.stats(),
+        "gemini_breakers": breaker_stats(),
+        "gemini_models": model_stats(),
+        "admission": admission.stats(),
+        "job_queue": job_queue.stats()
     }
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrics for this worker"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
 if __name__ == "__main__":
     uvicorn.run(
         "main:app",
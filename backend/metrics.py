@@ -0,0 +1,126 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Dict, Iterator, List, Optional, Tuple, TypeVar
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+T = TypeVar("T")
+
+# Pipeline stages span sub-millisecond cache hits to minute-long generations
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+STAGE_SECONDS = Histogram(
+    "formgen_stage_seconds",
+    "Time spent in each stage of the generation pipeline",
+    ["stage"],
+    buckets=STAGE_BUCKETS
+)
+GEMINI_RETRIES = Counter(
+    "formgen_gemini_retries_total",
+    "Gemini calls repeated after a failed attempt, by failure class",
+    ["reason"]
+)
+SCHEMA_PARSE = Counter(
+    "formgen_schema_parse_total",
+    "Model outputs parsed, by outcome (ok, repaired, invalid)",
+    ["outcome"]
+)
+GENERATIONS_IN_FLIGHT = Gauge(
+    "formgen_generations_in_flight",
+    "Generation requests being served, by endpoint",
+    ["endpoint"]
+)
+GEMINI_CALLS_IN_FLIGHT = Gauge("formgen_gemini_calls_in_flight", "Gemini calls in progress")
+EXECUTOR_IN_FLIGHT = Gauge("formgen_executor_in_flight", "Blocking calls running or queued on the executor")
+ADMISSION_RUNNING = Gauge("formgen_admission_running", "Generations holding an admission slot")
+ADMISSION_WAITING = Gauge("formgen_admission_waiting", "Generations waiting for an admission slot")
+
+# Per-request (stage, seconds) list read by ServerTimingMiddleware
+_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("server_timings", default=None)
+_stage_children: Dict[str, Any] = {}
+
+
+def record_stage(name: str, seconds: float) -> None:
+    """Observe a stage duration and add it to the current request's Server-Timing"""
+    child = _stage_children.get(name)
+    if child is None:
+        child = _stage_children[name] = STAGE_SECONDS.labels(name)
+    child.observe(seconds)
+
+    timings = _timings.get()
+    if timings is not None:
+        timings.append((name, seconds))
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time the enclosed block as a pipeline stage (recorded even if it raises)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+async def timed(name: str, awaitable: Awaitable[T]) -> T:
+    """Await a coroutine, timing it as a pipeline stage"""
+    with stage(name):
+        return await awaitable
+
+
+def server_timing_header(timings: List[Tuple[str, float]], total: float) -> str:
+    """Format stage timings as a Server-Timing header value (durations in ms)"""
+    entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+class ServerTimingMiddleware:
+    """
+    Adds a Server-Timing header with the stages recorded while serving a request
+
+    Plain ASGI middleware: it only wraps `send`, so streaming responses pass
+    through untouched (their header holds the stages done before the first
+    byte).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings: List[Tuple[str, float]] = []
+        token = _timings.set(timings)
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                header = server_timing_header(timings, time.perf_counter() - started)
+                message["headers"] = [*message.get("headers", []), (b"server-timing", header.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _timings.reset(token)
+
+
+def bind_gauges(executor_in_flight, admission_stats) -> None:
+    """
+    Point the saturation gauges at live values, read only when scraped
+
+    Args:
+        executor_in_flight: Callable returning the executor's in-flight calls
+        admission_stats: Callable returning the admission controller's stats
+    """
+    EXECUTOR_IN_FLIGHT.set_function(executor_in_flight)
+    ADMISSION_RUNNING.set_function(lambda: admission_stats()["running"])
+    ADMISSION_WAITING.set_function(lambda: admission_stats()["waiting"])
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Current metrics in the Prometheus text format, with its content type"""
+    return generate_latest(), CONTENT_TYPE_LATEST
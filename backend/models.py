@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Annotated, List, Optional
 from datetime import datetime
 
 
@@ -8,7 +8,11 @@ from datetime import datetime
 class FormQuestion(BaseModel):
     """Represents a single question in a Google Form"""
     title: str = Field(..., description="The question text")
-    question_type: str = Field(..., description="Question type: TEXT, MULTIPLE_CHOICE, or CHECKBOX")
+    question_type: str = Field(
+        ...,
+        description="Question type: TEXT, MULTIPLE_CHOICE, or CHECKBOX",
+        json_schema_extra={"enum": ["TEXT", "MULTIPLE_CHOICE", "CHECKBOX"]}
+    )
     options: Optional[List[str]] = Field(None, description="Options for MULTIPLE_CHOICE or CHECKBOX questions")
     required: bool = Field(True, description="Whether the question is required")
 
@@ -20,11 +24,27 @@ class FormSchema(BaseModel):
     questions: List[FormQuestion] = Field(..., description="List of questions")
 
 
+class GenerationUsage(BaseModel):
+    """Gemini usage of one schema generation, summed over all its attempts"""
+    model: Optional[str] = Field(None, description="Model that produced the schema")
+    prompt_tokens: int = 0
+    output_tokens: int = 0
+    cached: bool = Field(False, description="Served from the schema cache without a model call")
+
+    def add(self, model_name: str, usage_metadata) -> None:
+        """Account one model call's usage_metadata"""
+        self.model = model_name
+        if usage_metadata is not None:
+            self.prompt_tokens += getattr(usage_metadata, "prompt_token_count", 0) or 0
+            self.output_tokens += getattr(usage_metadata, "candidates_token_count", 0) or 0
+
+
 # ============ API Request/Response Models ============
 
 class FormGenerationRequest(BaseModel):
     """Request model for form generation endpoint"""
     prompt: str = Field(..., min_length=1, description="Natural language prompt describing the form")
+    use_cache: bool = Field(True, description="Reuse a cached schema for an identical prompt if available")
 
 
 class FormGenerationResponse(BaseModel):
@@ -35,6 +55,45 @@ class FormGenerationResponse(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 
+class BatchGenerationRequest(BaseModel):
+    """Request model for the batch generation endpoint"""
+    prompts: List[Annotated[str, Field(min_length=1)]] = Field(..., min_length=1, max_length=100, description="One prompt per form to generate")
+    use_cache: bool = Field(True, description="Reuse cached schemas for identical prompts if available")
+
+
+class BatchItemResult(BaseModel):
+    """Outcome of one prompt in a batch"""
+    index: int = Field(..., description="Position of the prompt in the request")
+    prompt: str
+    status: str = Field(..., description="succeeded or failed")
+    result: Optional[FormGenerationResponse] = None
+    error: Optional[str] = None
+
+
+class BatchGenerationResponse(BaseModel):
+    """Response model for the batch generation endpoint"""
+    results: List[BatchItemResult]
+    succeeded: int
+    failed: int
+
+
+class JobSubmissionResponse(BaseModel):
+    """Response model when a generation is queued as a background job"""
+    job_id: str = Field(..., description="ID to poll at /api/jobs/{job_id}")
+    status: str = Field("queued", description="Job status")
+    status_url: str = Field(..., description="URL to poll for the job status")
+
+
+class JobStatusResponse(BaseModel):
+    """Response model for the job status endpoint"""
+    job_id: str
+    status: str = Field(..., description="queued, running, succeeded or failed")
+    result: Optional[FormGenerationResponse] = Field(None, description="Generated form, once succeeded")
+    error: Optional[str] = Field(None, description="Failure reason, once failed")
+    created_at: datetime
+    updated_at: datetime
+
+
 # ============ MongoDB Document Models ============
 
 class UserSession(BaseModel):
@@ -61,4 +120,9 @@ class FormHistory(BaseModel):
     form_url: str
     form_title: str
     prompt: str
+    model: Optional[str] = None
+    prompt_tokens: int = 0
+    output_tokens: int = 0
+    cached: bool = False
+    latency_ms: Optional[float] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
@@ -1,8 +1,12 @@
-from fastapi import APIRouter, HTTPException, Response, Request
+from fastapi import APIRouter, HTTPException, Response, Depends
 from fastapi.responses import RedirectResponse
 import secrets
 from services.auth_service import get_auth_url, handle_callback, encrypt_token
-from database import create_session, get_session, delete_session, store_oauth_token, delete_oauth_token
+from executor import run_blocking
+from database import create_session, delete_session, store_oauth_token, delete_oauth_token
+from dependencies import get_optional_session
+from services.token_manager import token_manager
+from typing import Any, Dict, Optional
 
 router = APIRouter(prefix="/api/auth", tags=["authentication"])
 
@@ -48,22 +52,23 @@ async def callback(code: str, state: str = None, response: Response = None):
         # For stricter security, the frontend should verify the state matches what it received in /login
         
         # Exchange code for tokens
-        token_data, user_email = handle_callback(code)
+        token_data, user_email = await run_blocking(handle_callback, code)
         
         # Encrypt and store tokens
         encrypted_access = encrypt_token(token_data["access_token"])
         encrypted_refresh = encrypt_token(token_data["refresh_token"])
         
-        store_oauth_token(
+        await store_oauth_token(
             user_email=user_email,
             access_token=encrypted_access,
             refresh_token=encrypted_refresh,
-            expires_in=token_data["expires_in"]
+            token_expiry=token_data["expiry"]
         )
+        token_manager.remember(user_email, token_data["access_token"], encrypted_refresh, token_data["expiry"])
         
         # Create session
         session_id = secrets.token_urlsafe(32)
-        create_session(user_email=user_email, session_id=session_id)
+        await create_session(user_email=user_email, session_id=session_id)
         
         # Determine redirect URL based on environment
         import os
@@ -90,20 +95,13 @@ async def callback(code: str, state: str = None, response: Response = None):
 
 
 @router.get("/status")
-async def auth_status(request: Request):
+async def auth_status(session: Optional[Dict[str, Any]] = Depends(get_optional_session)):
     """
     Check current authentication status
     
     Returns:
         User authentication status
     """
-    session_id = request.cookies.get("session_id")
-    
-    if not session_id:
-        return {"authenticated": False}
-    
-    session = get_session(session_id)
-    
     if not session:
         return {"authenticated": False}
     
@@ -114,21 +112,18 @@ async def auth_status(request: Request):
 
 
 @router.post("/logout")
-async def logout(request: Request, response: Response):
+async def logout(response: Response, session: Optional[Dict[str, Any]] = Depends(get_optional_session)):
     """
     Logout user and clear session
     
     Returns:
         Success message
     """
-    session_id = request.cookies.get("session_id")
-    
-    if session_id:
-        session = get_session(session_id)
-        if session:
-            # Delete tokens and session
-            delete_oauth_token(session["user_email"])
-            delete_session(session_id)
+    if session:
+        # Delete tokens and session
+        await delete_oauth_token(session["user_email"])
+        token_manager.forget(session["user_email"])
+        await delete_session(session["session_id"])
     
     # Clear cookie
     response.delete_cookie("session_id")
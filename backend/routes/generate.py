@@ -1,116 +1,231 @@
-from fastapi import APIRouter, HTTPException, Request, Depends
-from models import FormGenerationRequest, FormGenerationResponse
-from services.gemini_service import generate_form_schema
-from services.google_form_service import GoogleFormService
-from services.google_form_service import GoogleFormService
-from services.auth_service import decrypt_token, refresh_access_token, encrypt_token
-from database import get_session, get_oauth_token, store_oauth_token, save_form_history, get_user_settings
-from datetime import datetime
+from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import JSONResponse, StreamingResponse
+from models import (
+    BatchGenerationRequest, BatchGenerationResponse,
+    FormGenerationRequest, FormGenerationResponse, GenerationUsage, JobSubmissionResponse
+)
+from services.schema_cache import stream_form_schema
+from services.generation import (
+    BUSY_DETAIL, SCHEMA_FAILED_DETAIL, GenerationError,
+    create_and_save_form, run_batch_generation, run_generation
+)
+from services.job_queue import QueueFullError, job_queue
+from services.circuit_breaker import CircuitOpenError
+from services.rate_limiter import (
+    AdmissionTimeoutError, RateLimitExceeded, admission, check_rate_limits, refund_rate_limits
+)
+from dependencies import UserContext, get_user_context
+from metrics import GENERATIONS_IN_FLIGHT
+from typing import Any, AsyncIterator, Optional
+import json
+import math
+import time
 
 router = APIRouter(prefix="/api", tags=["generation"])
 
+# Suggested client back-off when the job queue is full (seconds)
+QUEUE_FULL_RETRY_AFTER = 5
+# Suggested client back-off when this worker is at generation capacity (seconds)
+BUSY_RETRY_AFTER = 5
 
-def get_current_user(request: Request):
-    """Dependency to get current authenticated user"""
-    session_id = request.cookies.get("session_id")
-    
-    if not session_id:
-        raise HTTPException(status_code=401, detail="Not authenticated")
-    
-    session = get_session(session_id)
-    
-    if not session:
-        raise HTTPException(status_code=401, detail="Invalid or expired session")
-    
-    return session["user_email"]
 
+async def _enforce_rate_limits(user: UserContext, cost: int = 1, key_cost: Optional[int] = None) -> None:
+    """Charge the request to the user's and the Gemini key's rate limits, or reply 429"""
+    try:
+        await check_rate_limits(user.user_email, user.gemini_api_key, cost, key_cost)
+    except RateLimitExceeded as e:
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(math.ceil(e.retry_after))}
+        )
+
+
+async def _refund_rate_limits(user: UserContext) -> None:
+    """Give back the rate limit charge of a request rejected before it was served (503)"""
+    await refund_rate_limits(user.user_email, user.gemini_api_key)
 
-@router.post("/generate", response_model=FormGenerationResponse)
+
+@router.post(
+    "/generate",
+    response_model=FormGenerationResponse,
+    responses={202: {"model": JobSubmissionResponse}}
+)
 async def generate_form(
     request: FormGenerationRequest,
-    user_email: str = Depends(get_current_user)
+    async_mode: bool = Query(False, alias="async", description="Queue as a background job and return its ID"),
+    user: UserContext = Depends(get_user_context)
 ):
     """
     Main form generation endpoint
-    
+
+    Blocking SDK calls run on the bounded executor so a generation in
+    progress never stalls other requests on this worker.
+
     Flow:
-    1. Validate session
-    2. Retrieve user OAuth token
+    1. Validate session, load OAuth token and settings (user context)
+    2. Get a valid access token (refreshed ahead of expiry by the token manager)
     3. Call Gemini to generate form schema
     4. Call GoogleFormService to create form
     5. Save to history
     6. Return form URL
+
+    With ?async=true the same pipeline runs on the job queue instead: the
+    response is 202 with a job ID to poll at /api/jobs/{job_id}, or 503 with
+    Retry-After when the queue is full.
+
+    While Gemini is failing for this key the circuit breaker rejects the
+    request immediately with 503 and Retry-After.
+
+    Requests are rate limited per user and per Gemini key (429 with
+    Retry-After), and at most ADMISSION_CONCURRENCY generations run at once
+    on this worker; others wait briefly, then get 503 with Retry-After.
     """
-    try:
-        # Step 1: Get user's OAuth token
-        token_data = get_oauth_token(user_email)
-        
-        if not token_data:
-            raise HTTPException(status_code=401, detail="No OAuth token found. Please re-authenticate.")
-        
-        # Decrypt access token
-        access_token = decrypt_token(token_data["access_token"])
-        
-        # Check if token is expired and refresh if needed
-        if token_data["token_expiry"] < datetime.utcnow():
-            refresh_token = decrypt_token(token_data["refresh_token"])
-            new_token_data = refresh_access_token(refresh_token)
-            
-            # Update stored token
-            encrypted_access = encrypt_token(new_token_data["access_token"])
-            store_oauth_token(
-                user_email=user_email,
-                access_token=encrypted_access,
-                refresh_token=token_data["refresh_token"],  # Keep same refresh token
-                expires_in=new_token_data["expires_in"]
-            )
-            
-            access_token = new_token_data["access_token"]
-        
-        # Get user specific Gemini Key if available
-        user_settings = get_user_settings(user_email)
-        user_api_key = None
-        
-        if user_settings and "gemini_api_key" in user_settings:
-            try:
-                user_api_key = decrypt_token(user_settings["gemini_api_key"])
-            except Exception:
-                print("Failed to decrypt user API key, falling back to default")
-
-        # Step 2: Generate form schema with Gemini
-        form_schema = generate_form_schema(request.prompt, api_key=user_api_key)
-        
-        if not form_schema:
+    await _enforce_rate_limits(user)
+
+    if async_mode:
+        try:
+            job_id = await job_queue.submit(user.user_email, request.prompt, use_cache=request.use_cache)
+        except QueueFullError:
+            await _refund_rate_limits(user)
             raise HTTPException(
-                status_code=500,
-                detail="Failed to generate form schema. Please try rephrasing your prompt."
+                status_code=503,
+                detail="Too many queued generations. Please retry shortly.",
+                headers={"Retry-After": str(QUEUE_FULL_RETRY_AFTER)}
             )
-        
-        # Step 3: Create Google Form
-        form_service = GoogleFormService(access_token)
-        form_url, form_id = form_service.create_form(form_schema)
-        
-        # Step 4: Save to history
-        save_form_history(
-            user_email=user_email,
-            form_id=form_id,
-            form_url=form_url,
-            form_title=form_schema.title,
-            prompt=request.prompt
+        job = JobSubmissionResponse(job_id=job_id, status_url=f"/api/jobs/{job_id}")
+        return JSONResponse(status_code=202, content=job.model_dump())
+
+    try:
+        with GENERATIONS_IN_FLIGHT.labels("generate").track_inprogress():
+            async with admission.admit():
+                return await run_generation(user, request.prompt, use_cache=request.use_cache)
+
+    except AdmissionTimeoutError:
+        await _refund_rate_limits(user)
+        raise HTTPException(
+            status_code=503,
+            detail=BUSY_DETAIL,
+            headers={"Retry-After": str(BUSY_RETRY_AFTER)}
         )
-        
-        # Step 5: Return response
-        return FormGenerationResponse(
-            form_url=form_url,
-            form_id=form_id,
-            title=form_schema.title
+    except CircuitOpenError as e:
+        await _refund_rate_limits(user)
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(int(e.retry_after))}
         )
-        
-    except HTTPException:
-        raise
+    except GenerationError as e:
+        raise HTTPException(status_code=500, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Form generation failed: {str(e)}")
 
 
-# Import encrypt_token for token refresh
-from services.auth_service import encrypt_token
+@router.post("/generate/batch", response_model=BatchGenerationResponse)
+async def generate_form_batch(
+    request: BatchGenerationRequest,
+    user: UserContext = Depends(get_user_context)
+):
+    """
+    Generate one form per prompt in a single request
+
+    Runs with bounded concurrency, each prompt taking its own generation
+    slot, and reports each prompt separately, so a
+    partial failure still returns the forms that were created. Each prompt
+    counts against the rate limits: the user's up front, the Gemini key's
+    as the prompt starts (a prompt over the key's limit fails on its own).
+    """
+    await _enforce_rate_limits(user, cost=len(request.prompts), key_cost=0)
+
+    try:
+        with GENERATIONS_IN_FLIGHT.labels("batch").track_inprogress():
+            results = await run_batch_generation(user, request.prompts, use_cache=request.use_cache)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Batch generation failed: {str(e)}")
+
+    succeeded = sum(1 for item in results if item.status == "succeeded")
+    return BatchGenerationResponse(results=results, succeeded=succeeded, failed=len(results) - succeeded)
+
+
+def _sse(event: str, data: Any) -> str:
+    """Format a Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@router.post("/generate/stream")
+async def generate_form_stream(
+    request: FormGenerationRequest,
+    user: UserContext = Depends(get_user_context)
+):
+    """
+    Streaming form generation endpoint (Server-Sent Events)
+
+    Same pipeline and final result as /generate, reported as it happens:
+    - stage: {"stage": "generating" | "creating_form"}
+    - question: {"index": n, "question": {...}} as soon as each question is parsed
+    - reset: streamed questions are void and will be re-sent (fallback regeneration)
+    - result: the FormGenerationResponse
+    - error: {"detail": "..."}
+
+    Rate limits are checked before the stream starts (429); waiting for a
+    generation slot happens inside the stream.
+    """
+    await _enforce_rate_limits(user)
+
+    return StreamingResponse(
+        _generation_events(request, user),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def _generation_events(request: FormGenerationRequest, user: UserContext) -> AsyncIterator[str]:
+    try:
+        with GENERATIONS_IN_FLIGHT.labels("stream").track_inprogress():
+            async with admission.admit():
+                async for event in _stream_generation(request, user):
+                    yield event
+    except AdmissionTimeoutError:
+        await _refund_rate_limits(user)
+        yield _sse("error", {"detail": BUSY_DETAIL})
+
+
+async def _stream_generation(request: FormGenerationRequest, user: UserContext) -> AsyncIterator[str]:
+    try:
+        started = time.perf_counter()
+        access_token = await user.get_access_token()
+
+        yield _sse("stage", {"stage": "generating"})
+
+        usage = GenerationUsage()
+        form_schema = None
+        index = 0
+        async for kind, item in stream_form_schema(
+            request.prompt, api_key=user.gemini_api_key, use_cache=request.use_cache, usage=usage
+        ):
+            if kind == "question":
+                yield _sse("question", {"index": index, "question": item.model_dump()})
+                index += 1
+            elif kind == "reset":
+                yield _sse("reset", {})
+                index = 0
+            else:
+                form_schema = item
+
+        if not form_schema:
+            yield _sse("error", {"detail": SCHEMA_FAILED_DETAIL})
+            return
+
+        yield _sse("stage", {"stage": "creating_form"})
+        response = await create_and_save_form(
+            user.user_email, access_token, request.prompt, form_schema, usage=usage, started=started
+        )
+        yield _sse("result", response.model_dump(mode="json"))
+
+    except CircuitOpenError as e:
+        await _refund_rate_limits(user)
+        yield _sse("error", {"detail": str(e)})
+    except HTTPException as e:
+        yield _sse("error", {"detail": e.detail})
+    except Exception as e:
+        yield _sse("error", {"detail": f"Form generation failed: {str(e)}"})
@@ -1,65 +1,110 @@
-from fastapi import APIRouter, HTTPException, Request, Query
-from database import get_session, get_form_history
-from typing import List, Dict, Any
+from fastapi import APIRouter, HTTPException, Query, Depends, Response
+from bson import ObjectId
+from bson.errors import InvalidId
+from database import get_form_history, get_user_stats
+from dependencies import get_current_user
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+import base64
+import json
 
 router = APIRouter(prefix="/api", tags=["history"])
 
+# Fields a client may request with ?fields=
+HISTORY_FIELDS = {
+    "form_id", "form_url", "form_title", "prompt", "created_at",
+    "model", "prompt_tokens", "output_tokens", "cached", "latency_ms"
+}
+
+
+def _encode_cursor(record: Dict[str, Any]) -> str:
+    """Opaque cursor pointing just past a history record"""
+    position = {"created_at": record["created_at"].isoformat(), "id": str(record["_id"])}
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        position = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(position["created_at"]), ObjectId(position["id"])
+    except (ValueError, KeyError, TypeError, InvalidId):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 
 @router.get("/history")
 async def get_history(
-    request: Request,
+    response: Response,
     skip: int = Query(0, ge=0),
-    limit: int = Query(20, ge=1, le=100)
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
+    q: Optional[str] = Query(None, max_length=200, description="Search form titles"),
+    user_email: str = Depends(get_current_user)
 ) -> List[Dict[str, Any]]:
     """
     Retrieve user's form generation history
     
+    Pages are fetched by keyset on (created_at, _id): pass the
+    X-Next-Cursor header of one page as ?cursor= to get the next, at the
+    same cost however deep. The header is absent on the last page.
+    
     Args:
-        skip: Number of records to skip (pagination)
+        skip: Number of records to skip (offset pagination, ignored with cursor)
         limit: Maximum number of records to return
+        cursor: Opaque position returned by the previous page
+        fields: Subset of fields to return, e.g. form_title,form_url,created_at
+        q: Case-insensitive text to look for in form titles
         
     Returns:
         List of form history records
     """
-    session_id = request.cookies.get("session_id")
-    
-    if not session_id:
-        raise HTTPException(status_code=401, detail="Not authenticated")
-    
-    session = get_session(session_id)
-    
-    if not session:
-        raise HTTPException(status_code=401, detail="Invalid or expired session")
-    
-    user_email = session["user_email"]
-    
-    # Get history from database
-    history = get_form_history(user_email, skip=skip, limit=limit)
-    
+    projection = None
+    if fields:
+        projection = [field.strip() for field in fields.split(",") if field.strip()]
+        unknown = set(projection) - HISTORY_FIELDS
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+
+    after = _decode_cursor(cursor) if cursor else None
+
+    # Fetch one extra record to know whether another page follows
+    history = await get_form_history(
+        user_email,
+        skip=0 if after else skip,
+        limit=limit + 1,
+        after=after,
+        fields=projection,
+        title_query=q
+    )
+
+    if len(history) > limit:
+        history = history[:limit]
+        response.headers["X-Next-Cursor"] = _encode_cursor(history[-1])
+
     # Convert ObjectId to string for JSON serialization
     for record in history:
         record["_id"] = str(record["_id"])
-    
+
     return history
 
 @router.get("/stats")
-async def get_stats(request: Request) -> Dict[str, Any]:
-    """Get usage statistics for the user"""
-    session_id = request.cookies.get("session_id")
-    if not session_id:
-        raise HTTPException(status_code=401, detail="Not authenticated")
-    
-    session = get_session(session_id)
-    if not session:
-        raise HTTPException(status_code=401, detail="Invalid session")
+async def get_stats(user_email: str = Depends(get_current_user)) -> Dict[str, Any]:
+    """
+    Get usage statistics for the user
     
-    # Get all history to count
-    # Note: For production, we should have a more efficient specific count query
-    history = get_form_history(session["user_email"], skip=0, limit=1000)
+    Read from per-user counters maintained as forms are saved, so the cost
+    does not grow with the size of the history.
+    """
+    stats = await get_user_stats(user_email)
+    tokens_used = stats["prompt_tokens"] + stats["output_tokens"]
     
     return {
-        "total_forms": len(history),
-        # Hardcoded for now as we don't track these yet
+        "total_forms": stats["forms"],
+        # Responses live in Google Forms and are not tracked yet
         "total_responses": 0,
-        "tokens_used": "0" 
+        "tokens_used": str(tokens_used),
+        "prompt_tokens": stats["prompt_tokens"],
+        "output_tokens": stats["output_tokens"],
+        "avg_latency_ms": round(stats["latency_ms_total"] / stats["latency_samples"], 1) if stats["latency_samples"] else None
     }
@@ -0,0 +1,33 @@
+from fastapi import APIRouter, HTTPException, Depends
+from database import get_job
+from dependencies import get_current_user
+from models import JobStatusResponse
+
+router = APIRouter(prefix="/api", tags=["jobs"])
+
+
+@router.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_job_status(job_id: str, user_email: str = Depends(get_current_user)):
+    """
+    Poll the status of a background generation job
+    
+    Args:
+        job_id: ID returned by POST /api/generate?async=true
+        
+    Returns:
+        Job status, with the generated form once it has succeeded
+    """
+    job = await get_job(job_id)
+    
+    # Other users' jobs are indistinguishable from missing ones
+    if not job or job["user_email"] != user_email:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return JobStatusResponse(
+        job_id=job["_id"],
+        status=job["status"],
+        result=job.get("result"),
+        error=job.get("error"),
+        created_at=job["created_at"],
+        updated_at=job["updated_at"]
+    )
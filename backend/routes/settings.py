@@ -1,7 +1,9 @@
-from fastapi import APIRouter, HTTPException, Request, Body
-from database import get_session, get_user_settings, update_user_setting
+from fastapi import APIRouter, Depends
+from database import get_user_settings, update_user_setting
+from dependencies import get_current_user, get_optional_session
 from services.auth_service import encrypt_token, decrypt_token
 from pydantic import BaseModel
+from typing import Any, Dict, Optional
 import os
 
 router = APIRouter(prefix="/api/settings", tags=["settings"])
@@ -10,37 +12,24 @@ class GeminiKeyRequest(BaseModel):
     api_key: str
 
 @router.post("/gemini-key")
-async def save_gemini_key(request: Request, key_data: GeminiKeyRequest):
+async def save_gemini_key(key_data: GeminiKeyRequest, user_email: str = Depends(get_current_user)):
     """Save user's Gemini API key (encrypted)"""
-    session_id = request.cookies.get("session_id")
-    if not session_id:
-        raise HTTPException(status_code=401, detail="Not authenticated")
-    
-    session = get_session(session_id)
-    if not session:
-        raise HTTPException(status_code=401, detail="Invalid session")
-    
     if not key_data.api_key.strip():
         # If empty, maybe delete? For now just return
         return {"status": "skipped"}
         
     encrypted_key = encrypt_token(key_data.api_key)
-    update_user_setting(session["user_email"], "gemini_api_key", encrypted_key)
+    await update_user_setting(user_email, "gemini_api_key", encrypted_key)
     
     return {"status": "success"}
 
 @router.get("/gemini-key")
-async def get_gemini_key_status(request: Request):
+async def get_gemini_key_status(session: Optional[Dict[str, Any]] = Depends(get_optional_session)):
     """Check if user has a custom Gemini API key set"""
-    session_id = request.cookies.get("session_id")
-    if not session_id:
-        return {"is_set": False}
-    
-    session = get_session(session_id)
     if not session:
         return {"is_set": False}
         
-    settings = get_user_settings(session["user_email"])
+    settings = await get_user_settings(session["user_email"])
     is_set = False
     
     if settings and "gemini_api_key" in settings:
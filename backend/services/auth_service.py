@@ -1,13 +1,19 @@
-from google_auth_oauthlib.flow import Flow
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
+from services.google_clients import build_client
 import os
 from dotenv import load_dotenv
-from typing import Dict, Any, Tuple
-from cryptography.fernet import Fernet
+from typing import TYPE_CHECKING, Dict, Any, List, Tuple
+from datetime import datetime, timedelta
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+from functools import lru_cache
+from cache import TTLCache
 import base64
 import hashlib
 
+# google-auth and oauthlib are imported inside the functions that use them,
+# keeping them off the startup path
+if TYPE_CHECKING:
+    from google.oauth2.credentials import Credentials
+
 load_dotenv()
 
 # OAuth2 Configuration
@@ -15,6 +21,15 @@ CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
 CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
 REDIRECT_URI = os.getenv("GOOGLE_REDIRECT_URI", "http://localhost:8000/api/auth/callback")
 SECRET_KEY = os.getenv("SECRET_KEY", "")
+# Retired secret keys still accepted for decryption during rotation (comma-separated)
+PREVIOUS_SECRET_KEYS = [key for key in os.getenv("PREVIOUS_SECRET_KEYS", "").split(",") if key]
+
+# Short-lived cache of decrypted secrets, keyed by ciphertext; values are
+# (plaintext, whether it was encrypted with one of PREVIOUS_SECRET_KEYS)
+DECRYPT_CACHE_SIZE = int(os.getenv("DECRYPT_CACHE_SIZE", "1024"))
+DECRYPT_CACHE_TTL = float(os.getenv("DECRYPT_CACHE_TTL", "300"))
+
+_decrypt_cache = TTLCache(maxsize=DECRYPT_CACHE_SIZE, ttl=DECRYPT_CACHE_TTL)
 
 # Scopes required for Google Forms and Drive
 SCOPES = [
@@ -25,23 +40,67 @@ SCOPES = [
 ]
 
 # Encryption setup
-def get_cipher():
-    """Get Fernet cipher for token encryption"""
-    # Derive a key from SECRET_KEY
-    key = base64.urlsafe_b64encode(hashlib.sha256(SECRET_KEY.encode()).digest())
+def _derive_fernet(secret: str) -> Fernet:
+    """Derive a Fernet key from a secret"""
+    key = base64.urlsafe_b64encode(hashlib.sha256(secret.encode()).digest())
     return Fernet(key)
 
 
+@lru_cache(maxsize=1)
+def _fernets() -> List[Fernet]:
+    """Fernet for SECRET_KEY followed by those for PREVIOUS_SECRET_KEYS"""
+    return [_derive_fernet(key) for key in [SECRET_KEY, *PREVIOUS_SECRET_KEYS]]
+
+
+@lru_cache(maxsize=1)
+def get_cipher() -> MultiFernet:
+    """
+    Get cipher for token encryption (built once per process)
+    
+    Encrypts with SECRET_KEY and decrypts with SECRET_KEY or any of
+    PREVIOUS_SECRET_KEYS, so the key can be rotated without logging users out.
+    Stored secrets are re-encrypted under SECRET_KEY with rotate_token as
+    they are used, after which a previous key can be dropped.
+    """
+    return MultiFernet(_fernets())
+
+
 def encrypt_token(token: str) -> str:
     """Encrypt a token"""
-    cipher = get_cipher()
-    return cipher.encrypt(token.encode()).decode()
+    encrypted_token = get_cipher().encrypt(token.encode()).decode()
+    _decrypt_cache.set(encrypted_token, (token, False))
+    return encrypted_token
+
+
+def _decrypt(encrypted_token: str) -> Tuple[str, bool]:
+    """(plaintext, whether a previous key was needed), reusing recent results"""
+    cached = _decrypt_cache.get(encrypted_token)
+    if cached is not None:
+        return cached
+    for index, fernet in enumerate(_fernets()):
+        try:
+            decrypted = (fernet.decrypt(encrypted_token.encode()).decode(), index > 0)
+        except InvalidToken:
+            continue
+        _decrypt_cache.set(encrypted_token, decrypted)
+        return decrypted
+    raise InvalidToken
 
 
 def decrypt_token(encrypted_token: str) -> str:
-    """Decrypt a token"""
-    cipher = get_cipher()
-    return cipher.decrypt(encrypted_token.encode()).decode()
+    """Decrypt a token, reusing recent results for the same ciphertext"""
+    return _decrypt(encrypted_token)[0]
+
+
+def rotate_token(encrypted_token: str) -> str:
+    """
+    The token encrypted under the current SECRET_KEY
+
+    Returns the same ciphertext if it already is, so callers can compare to
+    decide whether the stored value needs rewriting.
+    """
+    token, stale = _decrypt(encrypted_token)
+    return encrypt_token(token) if stale else encrypted_token
 
 
 # ============ Stage 1: Generate OAuth URL ============
@@ -56,6 +115,8 @@ def get_auth_url(state: str = None) -> str:
     Returns:
         Authorization URL to redirect user to
     """
+    from google_auth_oauthlib.flow import Flow
+
     flow = Flow.from_client_config(
         {
             "web": {
@@ -92,6 +153,8 @@ def handle_callback(code: str) -> Tuple[Dict[str, Any], str]:
     Returns:
         Tuple of (token_data, user_email)
     """
+    from google_auth_oauthlib.flow import Flow
+
     flow = Flow.from_client_config(
         {
             "web": {
@@ -111,7 +174,7 @@ def handle_callback(code: str) -> Tuple[Dict[str, Any], str]:
     credentials = flow.credentials
     
     # Get user email
-    user_info_service = build('oauth2', 'v2', credentials=credentials)
+    user_info_service = build_client('oauth2', 'v2', credentials)
     user_info = user_info_service.userinfo().get().execute()
     user_email = user_info.get('email')
     
@@ -119,7 +182,7 @@ def handle_callback(code: str) -> Tuple[Dict[str, Any], str]:
     token_data = {
         "access_token": credentials.token,
         "refresh_token": credentials.refresh_token,
-        "expires_in": 3600  # Default 1 hour
+        "expiry": _credentials_expiry(credentials)
     }
     
     return token_data, user_email
@@ -137,6 +200,8 @@ def refresh_access_token(refresh_token: str) -> Dict[str, Any]:
     Returns:
         New token data
     """
+    from google.oauth2.credentials import Credentials
+
     credentials = Credentials(
         token=None,
         refresh_token=refresh_token,
@@ -151,11 +216,16 @@ def refresh_access_token(refresh_token: str) -> Dict[str, Any]:
     
     return {
         "access_token": credentials.token,
-        "expires_in": 3600
+        "expiry": _credentials_expiry(credentials)
     }
 
 
-def get_credentials_from_token(access_token: str) -> Credentials:
+def _credentials_expiry(credentials: "Credentials") -> datetime:
+    """Expiry reported by google-auth (naive UTC), defaulting to one hour"""
+    return credentials.expiry or datetime.utcnow() + timedelta(seconds=3600)
+
+
+def get_credentials_from_token(access_token: str) -> "Credentials":
     """
     Create Credentials object from access token
     
@@ -165,4 +235,6 @@ def get_credentials_from_token(access_token: str) -> Credentials:
     Returns:
         Google Credentials object
     """
+    from google.oauth2.credentials import Credentials
+
     return Credentials(token=access_token)
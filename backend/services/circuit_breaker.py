@@ -0,0 +1,146 @@
+import hashlib
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+from cache import TTLCache
+
+# Open the breaker when at least this share of recent calls failed...
+BREAKER_FAILURE_RATE = float(os.getenv("GEMINI_BREAKER_FAILURE_RATE", "0.5"))
+# ...out of at least this many calls in the rolling window
+BREAKER_MIN_CALLS = int(os.getenv("GEMINI_BREAKER_MIN_CALLS", "10"))
+BREAKER_WINDOW = int(os.getenv("GEMINI_BREAKER_WINDOW", "20"))
+# How long an open breaker fails fast before letting probe calls through
+BREAKER_OPEN_SECONDS = float(os.getenv("GEMINI_BREAKER_OPEN_SECONDS", "30"))
+BREAKER_HALF_OPEN_PROBES = int(os.getenv("GEMINI_BREAKER_HALF_OPEN_PROBES", "1"))
+BREAKER_CACHE_SIZE = int(os.getenv("GEMINI_BREAKER_CACHE_SIZE", "128"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Breakers per (model, API key); idle ones are dropped
+_breakers = TTLCache(maxsize=BREAKER_CACHE_SIZE, ttl=3600)
+_breakers_lock = threading.Lock()
+
+
+class CircuitOpenError(Exception):
+    """The upstream is failing; the call was rejected without being attempted"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Gemini is temporarily unavailable ({name}). Please retry in {retry_after:.0f}s.")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Thread-safe circuit breaker over a rolling window of call outcomes
+
+    Closed: calls pass and outcomes are recorded. When the failure rate over
+    the window crosses the threshold the breaker opens and rejects calls
+    for open_seconds, then half-opens and lets a few probe calls through:
+    a successful probe closes it again, a failed one re-opens it.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_rate: float = BREAKER_FAILURE_RATE,
+        min_calls: int = BREAKER_MIN_CALLS,
+        window: int = BREAKER_WINDOW,
+        open_seconds: float = BREAKER_OPEN_SECONDS,
+        half_open_probes: int = BREAKER_HALF_OPEN_PROBES
+    ):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self._outcomes = deque(maxlen=window)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self._rejected = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._probes = 0
+        return self._state
+
+    def before_call(self) -> None:
+        """
+        Admit a call or reject it
+
+        Raises:
+            CircuitOpenError: If the breaker is open, or half-open with all probes in flight
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return
+            if state == HALF_OPEN and self._probes < self.half_open_probes:
+                self._probes += 1
+                return
+            self._rejected += 1
+            retry_after = max(self.open_seconds - (time.monotonic() - self._opened_at), 1.0)
+            raise CircuitOpenError(self.name, retry_after)
+
+    def record(self, success: bool) -> None:
+        """Record the outcome of an admitted call"""
+        with self._lock:
+            state = self._current_state()
+            if state == HALF_OPEN:
+                self._probes = max(self._probes - 1, 0)
+                if success:
+                    self._state = CLOSED
+                    self._outcomes.clear()
+                else:
+                    self._open()
+                return
+
+            self._outcomes.append(success)
+            if state == CLOSED and len(self._outcomes) >= self.min_calls:
+                failures = self._outcomes.count(False)
+                if failures / len(self._outcomes) >= self.failure_rate:
+                    self._open()
+
+    def _open(self) -> None:
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._probes = 0
+        print(f"Circuit breaker opened for {self.name}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self._current_state(),
+                "recent_calls": len(self._outcomes),
+                "recent_failures": self._outcomes.count(False),
+                "rejected": self._rejected
+            }
+
+
+def get_breaker(model_name: str, api_key: Optional[str]) -> CircuitBreaker:
+    """Get the breaker guarding one model with one API key"""
+    name = f"{model_name}/{hashlib.sha256((api_key or '').encode()).hexdigest()[:8]}"
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(name)
+            if breaker is None:
+                breaker = CircuitBreaker(name)
+                _breakers.set(name, breaker)
+    return breaker
+
+
+def breaker_stats() -> Dict[str, Dict[str, Any]]:
+    """State of every active breaker, keyed by model and API key fingerprint"""
+    return {name: breaker.stats() for name, breaker in _breakers.items()}
@@ -1,15 +1,95 @@
-import google.generativeai as genai
 import os
-import json
+import hashlib
+import threading
+import time
+from collections import Counter
 from dotenv import load_dotenv
-from models import FormSchema
-from typing import Optional
+from pydantic import ValidationError
+from cache import TTLCache
+from metrics import GEMINI_CALLS_IN_FLIGHT, GEMINI_RETRIES, SCHEMA_PARSE, record_stage
+from models import FormSchema, GenerationUsage
+from services.circuit_breaker import CircuitBreaker, CircuitOpenError, get_breaker
+from services.json_repair import repair_json
+from services.model_router import GEMINI_MODEL, fallback_model, record_model_call, route_prompt
+from tracing import finish_span, set_span_attributes, span, start_span, usage_attributes
+from services.retry_policy import (
+    QUOTA, RETRYABLE, TIMEOUT, RetryPolicy, SafetyBlockedError,
+    classify_error, default_retry_policy, retry_after_hint
+)
+from typing import TYPE_CHECKING, Any, Dict, Iterator, Optional, Tuple
+
+if TYPE_CHECKING:
+    import google.generativeai as genai
 
 load_dotenv()
 
-# Configure Gemini API
+# Default Gemini API key (users may supply their own via settings)
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-genai.configure(api_key=GEMINI_API_KEY)
+
+# JSON Schema keywords that Gemini's response schema understands
+_GEMINI_SCHEMA_KEYS = ("type", "format", "description", "nullable", "enum", "required", "min_items", "max_items")
+
+
+def to_gemini_schema(schema: Dict[str, Any], defs: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Convert a Pydantic JSON schema into the OpenAPI subset Gemini accepts
+
+    Inlines $ref definitions, turns Optional (anyOf with null) into
+    nullable, and drops keywords Gemini rejects such as default and title.
+    """
+    defs = schema.get("$defs", {}) if defs is None else defs
+
+    if "$ref" in schema:
+        return to_gemini_schema(defs[schema["$ref"].rsplit("/", 1)[-1]], defs)
+
+    if "anyOf" in schema:
+        variants = [variant for variant in schema["anyOf"] if variant.get("type") != "null"]
+        if len(variants) == 1:
+            converted = to_gemini_schema(variants[0], defs)
+            converted["nullable"] = True
+            if "description" in schema:
+                converted["description"] = schema["description"]
+            return converted
+
+    converted = {key: schema[key] for key in _GEMINI_SCHEMA_KEYS if key in schema}
+    if "enum" in converted and converted.get("type") == "string":
+        converted["format"] = "enum"
+    if "properties" in schema:
+        converted["properties"] = {
+            name: to_gemini_schema(property_schema, defs)
+            for name, property_schema in schema["properties"].items()
+        }
+    if "items" in schema:
+        converted["items"] = to_gemini_schema(schema["items"], defs)
+    return converted
+
+
+# Generation settings shared by all model tiers; the router picks the model
+# and overrides max_output_tokens per prompt
+GENERATION_CONFIG = {
+    "temperature": 0.1,  # Low temperature for deterministic output
+    "top_p": 0.95,
+    "top_k": 40,
+    "max_output_tokens": 8192,
+    # Structured output: Gemini is constrained to JSON matching FormSchema
+    "response_mime_type": "application/json",
+    "response_schema": to_gemini_schema(FormSchema.model_json_schema()),
+}
+
+# Pool of models bound to their own API key, keyed by key hash
+MODEL_POOL_SIZE = int(os.getenv("GEMINI_MODEL_POOL_SIZE", "128"))
+MODEL_POOL_TTL = float(os.getenv("GEMINI_MODEL_POOL_TTL", "3600"))
+
+_model_pool = TTLCache(maxsize=MODEL_POOL_SIZE, ttl=MODEL_POOL_TTL)
+_model_pool_lock = threading.Lock()
+
+# Outcomes of parsing model output: ok, repaired (locally fixed) or invalid
+_parse_stats = Counter()
+_parse_stats_lock = threading.Lock()
+
+# Candidate finish reasons meaning the answer was withheld, by enum name so
+# the SDK's types are not needed before the first call
+_BLOCKED_FINISH_REASONS = {"SAFETY", "RECITATION", "BLOCKLIST", "PROHIBITED_CONTENT", "SPII"}
 
 # System instruction for precise JSON output
 SYSTEM_INSTRUCTION = """You are a precise form schema generator. Output ONLY valid JSON matching the FormSchema structure. 
@@ -31,18 +111,234 @@ The JSON structure must be:
 }"""
 
 
-def generate_form_schema(prompt: str, max_retries: int = 3, api_key: str = None) -> Optional[FormSchema]:
+def create_model(api_key: str, model_name: str, **kwargs) -> "genai.GenerativeModel":
     """
-    Generate form schema from natural language prompt using Gemini 3 Pro
+    Create a GenerativeModel bound to its own API key
+    
+    Avoids the process-global genai.configure(), which concurrent requests
+    with different user keys would otherwise overwrite. The SDK is imported
+    here, on first use, since it dominates the app's import time.
+    """
+    import google.generativeai as genai
+    from google.ai import generativelanguage as glm
+
+    model = genai.GenerativeModel(model_name=model_name, **kwargs)
+    # The SDK has no public per-model key option; give the model its own client
+    model._client = glm.GenerativeServiceClient(client_options={"api_key": api_key})
+    return model
+
+
+def get_schema_model(api_key: str, model_name: str = GEMINI_MODEL) -> "genai.GenerativeModel":
+    """Get the pooled schema-generation model for an API key, creating it on first use"""
+    pool_key = (hashlib.sha256(api_key.encode()).hexdigest(), model_name)
+    model = _model_pool.get(pool_key)
+    if model is None:
+        with _model_pool_lock:
+            model = _model_pool.get(pool_key)
+            if model is None:
+                model = create_model(
+                    api_key,
+                    model_name,
+                    generation_config=GENERATION_CONFIG,
+                    system_instruction=SYSTEM_INSTRUCTION
+                )
+                _model_pool.set(pool_key, model)
+    return model
+
+
+def model_pool_stats() -> dict:
+    """Size and hit/miss counters of the model pool"""
+    return _model_pool.stats()
+
+
+def _count_parse(outcome: str) -> None:
+    with _parse_stats_lock:
+        _parse_stats[outcome] += 1
+    SCHEMA_PARSE.labels(outcome).inc()
+
+
+def parse_stats() -> Dict[str, int]:
+    """Counts of model outputs that parsed, needed local repair, or were invalid"""
+    with _parse_stats_lock:
+        return {outcome: _parse_stats[outcome] for outcome in ("ok", "repaired", "invalid")}
+
+
+def parse_form_schema(response_text: str) -> FormSchema:
+    """
+    Parse and validate model output into a FormSchema
+    
+    With structured output the response is plain JSON, so it is validated
+    in a single pass straight from the text, without an intermediate dict.
+    
+    Raises:
+        pydantic.ValidationError: If the output is not valid JSON or does not match FormSchema
+    """
+    return FormSchema.model_validate_json(response_text)
+
+
+def stream_form_schema_text(prompt: str, api_key: str = None, usage: Optional[GenerationUsage] = None) -> Iterator[str]:
+    """
+    Stream raw model output for a prompt, chunk by chunk
     
     Args:
         prompt: Natural language description of the form
-        max_retries: Maximum number of retry attempts if JSON parsing fails
         api_key: Optional custom API key. If None, uses default from env.
+        usage: Receives the model name and token counts
+        
+    Yields:
+        Text chunks as Gemini produces them
+    """
+    key_to_use = api_key if api_key else GEMINI_API_KEY
+    
+    if not key_to_use:
+        raise ValueError("No Gemini API Key found")
+    
+    route = route_prompt(prompt)
+    model_name, breaker = _admit(route.model_name, key_to_use)
+    started = time.perf_counter()
+    usage_metadata = None
+    healthy = True
+    error = None
+    stream_span = None
+    GEMINI_CALLS_IN_FLIGHT.inc()
+    # Everything after admission is inside the try, so the breaker always
+    # gets an outcome and a half-open probe slot is never leaked
+    try:
+        model = get_schema_model(key_to_use, model_name)
+        # Not made current: the generator is suspended between chunks
+        stream_span = start_span("gemini.stream_content", {"gen_ai.request.model": model_name})
+        for chunk in model.generate_content(
+            prompt,
+            stream=True,
+            generation_config={"max_output_tokens": route.max_output_tokens},
+            # Same per-call budget as generate_form_schema, so a stalled
+            # stream cannot hold its executor thread indefinitely
+            request_options={"timeout": min(default_retry_policy.attempt_timeout, default_retry_policy.deadline)}
+        ):
+            usage_metadata = chunk.usage_metadata
+            yield chunk.text
+    except Exception as e:
+        healthy = classify_error(e) not in RETRYABLE
+        error = e
+        raise
+    finally:
+        GEMINI_CALLS_IN_FLIGHT.dec()
+        finish_span(stream_span, usage_attributes(model_name, usage_metadata), error)
+        elapsed = time.perf_counter() - started
+        record_stage("gemini_stream", elapsed)
+        breaker.record(healthy)
+        record_model_call(model_name, elapsed, usage_metadata, success=healthy)
+        if usage is not None:
+            usage.add(model_name, usage_metadata)
+
+
+def _admit(model_name: str, api_key: str) -> Tuple[str, CircuitBreaker]:
+    """
+    Pass the breaker for a model, moving to the fallback model if it is open
+
+    Returns:
+        (model actually admitted, its breaker)
+
+    Raises:
+        CircuitOpenError: If no model is available
+    """
+    breaker = get_breaker(model_name, api_key)
+    try:
+        breaker.before_call()
+        return model_name, breaker
+    except CircuitOpenError:
+        fallback = fallback_model(model_name)
+        if fallback is None:
+            raise
+        print(f"Circuit open for {model_name}, using {fallback}")
+        breaker = get_breaker(fallback, api_key)
+        breaker.before_call()
+        return fallback, breaker
+
+
+def repair_form_schema(response_text: str) -> Optional[FormSchema]:
+    """Parse model output after local JSON repair, or None if it is beyond repair"""
+    repaired = repair_json(response_text)
+    if repaired is None:
+        return None
+    try:
+        return parse_form_schema(repaired)
+    except ValidationError:
+        return None
+
+
+def load_form_schema(response_text: str) -> Optional[FormSchema]:
+    """
+    Parse model output, falling back to local repair, and record the outcome
+
+    Returns:
+        FormSchema object or None if the output is invalid even after repair
+    """
+    try:
+        form_schema = parse_form_schema(response_text)
+        _count_parse("ok")
+        return form_schema
+    except ValidationError:
+        pass
+
+    form_schema = repair_form_schema(response_text)
+    _count_parse("invalid" if form_schema is None else "repaired")
+    return form_schema
+
+
+def _response_text(response) -> str:
+    """
+    Text of a generate_content response
+
+    Raises:
+        SafetyBlockedError: If the prompt or the answer was blocked
+    """
+    block_reason = getattr(response.prompt_feedback, "block_reason", 0)
+    if block_reason:
+        raise SafetyBlockedError(f"Prompt blocked: {block_reason}")
+    if not response.candidates:
+        raise SafetyBlockedError("Prompt blocked: no candidates returned")
+    if getattr(response.candidates[0].finish_reason, "name", None) in _BLOCKED_FINISH_REASONS:
+        raise SafetyBlockedError(f"Response blocked: {response.candidates[0].finish_reason}")
+    return response.text
+
+
+def generate_form_schema(
+    prompt: str,
+    max_retries: Optional[int] = None,
+    api_key: str = None,
+    policy: Optional[RetryPolicy] = None,
+    cancelled: Optional[threading.Event] = None,
+    usage: Optional[GenerationUsage] = None
+) -> Optional[FormSchema]:
+    """
+    Generate form schema from natural language prompt using Gemini
+    
+    The model and output budget are picked by the router from the prompt
+    size. Upstream failures are classified: auth, safety and invalid-request
+    errors fail immediately; a timeout or exhausted quota moves to the
+    fallback model; other transient errors are retried with jittered
+    exponential backoff (honouring server retry-after hints) until the
+    policy deadline. Output that does not parse is first repaired locally
+    before another model call is spent. Every call goes through the circuit
+    breaker for its model and key.
+    
+    Args:
+        prompt: Natural language description of the form
+        max_retries: Maximum number of model calls (defaults to the policy's)
+        api_key: Optional custom API key. If None, uses default from env.
+        policy: Retry policy (defaults to the env-configured one)
+        cancelled: Set by the caller to stop before the next attempt (hedging)
+        usage: Receives the model name and token counts of all attempts
         
     Returns:
         FormSchema object or None if generation fails
+        
+    Raises:
+        CircuitOpenError: If the breaker is open and the call was not attempted
     """
+    policy = policy or default_retry_policy
+    max_attempts = max_retries or policy.max_attempts
     
     # Use provided key or fallback to env var
     key_to_use = api_key if api_key else GEMINI_API_KEY
@@ -51,58 +347,86 @@ def generate_form_schema(prompt: str, max_retries: int = 3, api_key: str = None)
         print("Error: No Gemini API Key found")
         return None
         
-    genai.configure(api_key=key_to_use)
+    route = route_prompt(prompt)
+    model_name = route.model_name
+    call_config = {"max_output_tokens": route.max_output_tokens}
+    deadline = time.monotonic() + policy.deadline
     
-    model = genai.GenerativeModel(
-        model_name="gemini-2.5-flash",  # Using stable Flash model
-        generation_config={
-            "temperature": 0.1,  # Low temperature for deterministic output
-            "top_p": 0.95,
-            "top_k": 40,
-            "max_output_tokens": 8192,
-        },
-        system_instruction=SYSTEM_INSTRUCTION
-    )
-    
-    for attempt in range(max_retries):
+    for attempt in range(1, max_attempts + 1):
+        if cancelled is not None and cancelled.is_set():
+            return None
+        
+        model_name, breaker = _admit(model_name, key_to_use)
+        started = time.perf_counter()
+        kind = error = None
+        # Everything after admission is inside the try, so the breaker always
+        # gets an outcome and a half-open probe slot is never leaked
         try:
-            # Generate content
-            response = model.generate_content(prompt)
-            response_text = response.text.strip()
-            
-            # Remove markdown code blocks if present
-            if response_text.startswith("```"):
-                # Extract JSON from code block
-                lines = response_text.split("\n")
-                response_text = "\n".join(lines[1:-1]) if len(lines) > 2 else response_text
-                response_text = response_text.replace("```json", "").replace("```", "").strip()
+            model = get_schema_model(key_to_use, model_name)
+            timeout = min(policy.attempt_timeout, deadline - time.monotonic())
+            with span("gemini.generate_content", {"gen_ai.request.model": model_name, "gemini.attempt": attempt}) as attempt_span:
+                with GEMINI_CALLS_IN_FLIGHT.track_inprogress():
+                    response = model.generate_content(
+                        prompt,
+                        generation_config=call_config,
+                        request_options={"timeout": timeout}
+                    )
+                set_span_attributes(attempt_span, usage_attributes(model_name, response.usage_metadata))
+            elapsed = time.perf_counter() - started
+            record_stage("gemini_attempt", elapsed)
+            response_text = _response_text(response)
+            record_model_call(model_name, elapsed, response.usage_metadata)
+            if usage is not None:
+                usage.add(model_name, response.usage_metadata)
             
-            # Parse JSON
-            form_data = json.loads(response_text)
-            
-            # Validate with Pydantic
-            form_schema = FormSchema(**form_data)
-            
-            return form_schema
-            
-        except json.JSONDecodeError as e:
-            print(f"Attempt {attempt + 1}/{max_retries}: JSON parsing failed - {e}")
-            if attempt == max_retries - 1:
-                print(f"Raw response: {response_text}")
-                return None
-                
         except Exception as e:
-            print(f"Attempt {attempt + 1}/{max_retries}: Error - {e}")
-            if attempt == max_retries - 1:
+            kind, error = classify_error(e), e
+            elapsed = time.perf_counter() - started
+            record_stage("gemini_attempt", elapsed)
+            record_model_call(model_name, elapsed, success=False)
+            print(f"Attempt {attempt}/{max_attempts}: {model_name} {kind} error - {e}")
+        finally:
+            # Only upstream trouble counts against the breaker, not bad keys or blocked prompts
+            breaker.record(kind not in RETRYABLE)
+        
+        if kind is not None:
+            if kind not in RETRYABLE or attempt == max_attempts:
                 return None
+            GEMINI_RETRIES.labels(kind).inc()
+            fallback = fallback_model(model_name) if kind in (QUOTA, TIMEOUT) else None
+            if time.monotonic() >= deadline:
+                # A call started now could only time out, and would count against its model
+                print("Gemini retry deadline exceeded")
+                return None
+            if fallback is not None:
+                # A different model has its own quota and load: retry at once
+                print(f"Falling back from {model_name} to {fallback}")
+                model_name = fallback
+                continue
+            delay = policy.backoff(attempt, retry_after_hint(error))
+            if time.monotonic() + delay >= deadline:
+                print("Gemini retry deadline exceeded")
+                return None
+            time.sleep(delay)
+            continue
+        
+        form_schema = load_form_schema(response_text)
+        if form_schema is not None:
+            return form_schema
+        
+        print(f"Attempt {attempt}/{max_attempts}: JSON parsing failed")
+        if attempt == max_attempts or time.monotonic() >= deadline:
+            print(f"Raw response: {response_text}")
+            return None
+        GEMINI_RETRIES.labels("parse").inc()
     
     return None
 
 
-def test_gemini_connection() -> bool:
-    """Test Gemini API connectivity"""
+def test_gemini_connection(model_name: str = GEMINI_MODEL) -> bool:
+    """Test Gemini API connectivity with a model (the standard tier by default)"""
     try:
-        model = genai.GenerativeModel("gemini-2.0-flash-exp")
+        model = create_model(GEMINI_API_KEY, model_name)
         response = model.generate_content("Say 'connected' if you can read this.")
         return "connected" in response.text.lower()
     except Exception as e:
@@ -0,0 +1,210 @@
+import asyncio
+import hashlib
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from cache import TTLCache
+from dependencies import UserContext
+from executor import run_blocking
+from metrics import stage
+from database import save_form_history, save_form_history_many
+from models import BatchItemResult, FormGenerationResponse, FormSchema, GenerationUsage
+from services.gemini_service import GEMINI_API_KEY
+from services.google_form_service import GoogleFormService
+from services.circuit_breaker import CircuitOpenError
+from services.rate_limiter import (
+    AdmissionTimeoutError, RateLimitExceeded, admission, check_rate_limits, refund_rate_limits
+)
+from services.schema_cache import get_form_schema
+
+SCHEMA_FAILED_DETAIL = "Failed to generate form schema. Please try rephrasing your prompt."
+BUSY_DETAIL = "Server is busy. Please retry shortly."
+
+# Prompts of one batch processed concurrently
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+# Concurrent Gemini calls per API key across all batches on this worker
+GEMINI_KEY_CONCURRENCY = int(os.getenv("GEMINI_KEY_CONCURRENCY", "8"))
+KEY_SEMAPHORE_CACHE_SIZE = int(os.getenv("KEY_SEMAPHORE_CACHE_SIZE", "1000"))
+
+# Idle per-key semaphores, bounded; semaphores with holders or waiters are
+# pinned in _key_semaphores_in_use (with their count) so they are never evicted
+_key_semaphores = TTLCache(maxsize=KEY_SEMAPHORE_CACHE_SIZE, ttl=3600)
+_key_semaphores_in_use: Dict[str, List[Any]] = {}
+
+
+class GenerationError(Exception):
+    """Form generation failed for a reason that can be shown to the user"""
+
+
+async def create_form(access_token: str, form_schema: FormSchema) -> Tuple[str, str]:
+    """Create the Google Form for a schema, returning (form_url, form_id)"""
+    form_service = GoogleFormService(access_token)
+    return await run_blocking(form_service.create_form, form_schema)
+
+
+def generation_metrics(usage: Optional[GenerationUsage], started: Optional[float]) -> Dict[str, Any]:
+    """
+    History fields describing how a form was generated
+
+    Args:
+        usage: Gemini usage of the schema generation
+        started: time.perf_counter() when the generation started
+    """
+    metrics = usage.model_dump() if usage is not None else {}
+    if started is not None:
+        metrics["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return metrics
+
+
+async def create_and_save_form(
+    user_email: str,
+    access_token: str,
+    prompt: str,
+    form_schema: FormSchema,
+    usage: Optional[GenerationUsage] = None,
+    started: Optional[float] = None
+) -> FormGenerationResponse:
+    """
+    Create the Google Form for a schema and record it in the user's history
+
+    The history entry carries the Gemini usage and, if `started` is given,
+    the end-to-end latency of the generation.
+    """
+    form_url, form_id = await create_form(access_token, form_schema)
+
+    with stage("history_save"):
+        await save_form_history(
+            user_email=user_email,
+            form_id=form_id,
+            form_url=form_url,
+            form_title=form_schema.title,
+            prompt=prompt,
+            metrics=generation_metrics(usage, started)
+        )
+
+    return FormGenerationResponse(
+        form_url=form_url,
+        form_id=form_id,
+        title=form_schema.title
+    )
+
+
+async def run_generation(user: UserContext, prompt: str, use_cache: bool = True) -> FormGenerationResponse:
+    """
+    Run the full generation pipeline for a user
+
+    Flow:
+    1. Get a valid access token (refreshed ahead of expiry by the token manager)
+    2. Generate form schema with Gemini (user's own key if set), or reuse a cached one
+    3. Create Google Form
+    4. Save to history
+
+    Raises:
+        GenerationError: If no schema could be generated
+    """
+    started = time.perf_counter()
+    access_token = await user.get_access_token()
+
+    usage = GenerationUsage()
+    form_schema = await get_form_schema(prompt, api_key=user.gemini_api_key, use_cache=use_cache, usage=usage)
+
+    if not form_schema:
+        raise GenerationError(SCHEMA_FAILED_DETAIL)
+
+    return await create_and_save_form(user.user_email, access_token, prompt, form_schema, usage=usage, started=started)
+
+
+@asynccontextmanager
+async def _key_slot(api_key: Optional[str]) -> AsyncIterator[None]:
+    """Hold one of the concurrent batch Gemini calls allowed for an API key"""
+    key_hash = hashlib.sha256((api_key or "").encode()).hexdigest()
+    entry = _key_semaphores_in_use.get(key_hash)
+    if entry is None:
+        semaphore = _key_semaphores.get(key_hash) or asyncio.Semaphore(GEMINI_KEY_CONCURRENCY)
+        _key_semaphores.pop(key_hash)
+        entry = _key_semaphores_in_use[key_hash] = [semaphore, 0]
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0:
+            del _key_semaphores_in_use[key_hash]
+            _key_semaphores.set(key_hash, entry[0])
+
+
+async def run_batch_generation(user: UserContext, prompts: List[str], use_cache: bool = True) -> List[BatchItemResult]:
+    """
+    Generate one form per prompt with bounded concurrency
+
+    The user context and access token are resolved once for the whole
+    batch, Gemini calls are limited per API key, and all history entries
+    are written with a single insert_many. A failing prompt does not stop
+    the others.
+
+    The caller charges the user's rate limit for the whole batch; the Gemini
+    key's rate limit is charged here as each prompt starts. Each prompt also
+    takes its own admission slot. A prompt that is not served (rate limited,
+    no slot in time, or breaker open) fails and is refunded.
+
+    Returns:
+        One result per prompt, in request order
+    """
+    access_token = await user.get_access_token()
+    api_key = user.gemini_api_key
+    batch_limit = asyncio.Semaphore(BATCH_CONCURRENCY)
+    metrics: Dict[int, Dict[str, Any]] = {}
+
+    async def generate_one(index: int, prompt: str) -> BatchItemResult:
+        async with batch_limit:
+            try:
+                async with admission.admit():
+                    started = time.perf_counter()
+                    usage = GenerationUsage()
+                    await check_rate_limits(user.user_email, api_key, cost=0, key_cost=1)
+                    async with _key_slot(api_key or GEMINI_API_KEY):
+                        form_schema = await get_form_schema(prompt, api_key=api_key, use_cache=use_cache, usage=usage)
+
+                    if not form_schema:
+                        raise GenerationError(SCHEMA_FAILED_DETAIL)
+
+                    form_url, form_id = await create_form(access_token, form_schema)
+                metrics[index] = generation_metrics(usage, started)
+                result = FormGenerationResponse(form_url=form_url, form_id=form_id, title=form_schema.title)
+                return BatchItemResult(index=index, prompt=prompt, status="succeeded", result=result)
+
+            except (AdmissionTimeoutError, RateLimitExceeded) as e:
+                # The key was not charged yet
+                await refund_rate_limits(user.user_email, api_key, key_cost=0)
+                error = BUSY_DETAIL if isinstance(e, AdmissionTimeoutError) else str(e)
+                return BatchItemResult(index=index, prompt=prompt, status="failed", error=error)
+            except CircuitOpenError as e:
+                await refund_rate_limits(user.user_email, api_key)
+                return BatchItemResult(index=index, prompt=prompt, status="failed", error=str(e))
+            except GenerationError as e:
+                return BatchItemResult(index=index, prompt=prompt, status="failed", error=str(e))
+            except Exception as e:
+                return BatchItemResult(index=index, prompt=prompt, status="failed", error=f"Form generation failed: {str(e)}")
+
+    results = await asyncio.gather(*(generate_one(index, prompt) for index, prompt in enumerate(prompts)))
+
+    # The forms exist either way: a failed history write must not hide their URLs
+    try:
+        with stage("history_save"):
+            await save_form_history_many([
+                {
+                    "user_email": user.user_email,
+                    "form_id": item.result.form_id,
+                    "form_url": item.result.form_url,
+                    "form_title": item.result.title,
+                    "prompt": item.prompt,
+                    **metrics[item.index]
+                }
+                for item in results if item.result
+            ])
+    except Exception as e:
+        print(f"Saving batch history failed for {user.user_email}: {e}")
+
+    return list(results)
@@ -0,0 +1,71 @@
+import json
+import os
+import threading
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Dict
+
+# The Google client libraries are imported where first used, off the startup path
+if TYPE_CHECKING:
+    import httplib2
+    from google.oauth2.credentials import Credentials
+    from googleapiclient.discovery import Resource
+
+# Socket timeout for Google API calls (seconds)
+GOOGLE_API_TIMEOUT = float(os.getenv("GOOGLE_API_TIMEOUT", "30"))
+
+# httplib2.Http is not thread-safe, so each executor thread keeps its own
+# keep-alive connection pool
+_local = threading.local()
+
+
+@lru_cache(maxsize=None)
+def get_discovery_document(service_name: str, version: str) -> Dict[str, Any]:
+    """
+    Load and parse a bundled discovery document once per process
+
+    Args:
+        service_name: API name, e.g. 'forms'
+        version: API version, e.g. 'v1'
+
+    Returns:
+        Parsed discovery document
+    """
+    from googleapiclient.discovery_cache import get_static_doc
+
+    content = get_static_doc(service_name, version)
+    if content is None:
+        raise ValueError(f"No bundled discovery document for {service_name} {version}")
+    return json.loads(content)
+
+
+def get_http() -> "httplib2.Http":
+    """Get this thread's pooled HTTP transport"""
+    http = getattr(_local, "http", None)
+    if http is None:
+        import httplib2
+
+        http = httplib2.Http(timeout=GOOGLE_API_TIMEOUT)
+        _local.http = http
+    return http
+
+
+def build_client(service_name: str, version: str, credentials: "Credentials") -> "Resource":
+    """
+    Build a lightweight API client bound to user credentials
+
+    Must be used on the thread that created it, since it shares that
+    thread's HTTP transport.
+
+    Args:
+        service_name: API name, e.g. 'forms'
+        version: API version, e.g. 'v1'
+        credentials: User's OAuth credentials
+
+    Returns:
+        Discovery-based API client
+    """
+    from google_auth_httplib2 import AuthorizedHttp
+    from googleapiclient.discovery import build_from_document
+
+    http = AuthorizedHttp(credentials, http=get_http())
+    return build_from_document(get_discovery_document(service_name, version), http=http)
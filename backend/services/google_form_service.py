@@ -1,7 +1,12 @@
-from googleapiclient.discovery import build
-from google.oauth2.credentials import Credentials
+from functools import cached_property
+from metrics import stage
+from tracing import span
 from models import FormSchema, FormQuestion
-from typing import Dict, Any, Tuple
+from services.google_clients import build_client
+from typing import TYPE_CHECKING, Dict, Any, Tuple
+
+if TYPE_CHECKING:
+    from googleapiclient.discovery import Resource
 
 
 class GoogleFormService:
@@ -14,8 +19,14 @@ class GoogleFormService:
         Args:
             access_token: User's OAuth access token
         """
+        from google.oauth2.credentials import Credentials
+
         self.credentials = Credentials(token=access_token)
-        self.service = build('forms', 'v1', credentials=self.credentials)
+
+    @cached_property
+    def service(self) -> "Resource":
+        """Forms API client, built on first use in the calling thread"""
+        return build_client('forms', 'v1', self.credentials)
     
     def create_form(self, form_schema: FormSchema) -> Tuple[str, str]:
         """
@@ -35,7 +46,8 @@ class GoogleFormService:
             }
         }
         
-        result = self.service.forms().create(body=form).execute()
+        with stage("form_create"), span("forms.create"):
+            result = self.service.forms().create(body=form).execute()
         form_id = result["formId"]
         
         # Step 2: Build batchUpdate request with all questions
@@ -59,10 +71,11 @@ class GoogleFormService:
         
         # Execute batchUpdate
         if requests:
-            self.service.forms().batchUpdate(
-                formId=form_id,
-                body={"requests": requests}
-            ).execute()
+            with stage("form_batch_update"), span("forms.batchUpdate", {"forms.requests": len(requests)}):
+                self.service.forms().batchUpdate(
+                    formId=form_id,
+                    body={"requests": requests}
+                ).execute()
         
         # Construct form URL
         form_url = f"https://docs.google.com/forms/d/{form_id}/edit"
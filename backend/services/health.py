@@ -0,0 +1,112 @@
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+from database import ping_database
+from executor import executor_stats
+from services.circuit_breaker import OPEN, breaker_stats
+
+# How often the background checker refreshes the readiness snapshot (seconds)
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", "5"))
+HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", "2"))
+# Not ready while more blocking calls are in flight than this multiple of executor workers
+READY_MAX_EXECUTOR_LOAD = float(os.getenv("READY_MAX_EXECUTOR_LOAD", "2"))
+
+
+class HealthChecker:
+    """
+    Readiness computed in the background and served from a snapshot
+
+    Probes read the last snapshot (pre-serialized), so they never touch
+    MongoDB and cost the same however often the load balancer polls. A
+    snapshot older than three intervals means the checker itself is stuck
+    and reads as not ready.
+
+    Open Gemini breakers are reported but do not fail readiness: Gemini is
+    shared by every worker, so taking them all out of rotation would turn
+    an upstream outage into a full one.
+    """
+
+    def __init__(self, interval: float, timeout: float):
+        self.interval = interval
+        self.timeout = timeout
+        self.mongo_ready = asyncio.Event()
+        self._mongo_up: Optional[bool] = None
+        self._ready = False
+        self._checked_at = 0.0
+        self._body = json.dumps({"ready": False, "checked_at": None, "checks": {}}).encode()
+
+    async def _check_mongo(self) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(ping_database(), self.timeout)
+            up, error = True, None
+        except Exception as e:
+            up, error = False, str(e) or type(e).__name__
+
+        if up != self._mongo_up:
+            print("✓ MongoDB connection successful" if up else f"✗ MongoDB connection failed: {error}")
+            self._mongo_up = up
+        if up:
+            self.mongo_ready.set()
+
+        return {
+            "status": "up" if up else "down",
+            "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+            "error": error
+        }
+
+    @staticmethod
+    def _check_gemini() -> Dict[str, Any]:
+        open_breakers = sorted(name for name, stats in breaker_stats().items() if stats["state"] == OPEN)
+        return {"status": "degraded" if open_breakers else "ok", "open_breakers": open_breakers}
+
+    @staticmethod
+    def _check_executor() -> Dict[str, Any]:
+        stats = executor_stats()
+        load = stats["in_flight"] / stats["workers"]
+        return {
+            "status": "saturated" if load > READY_MAX_EXECUTOR_LOAD else "ok",
+            "in_flight": stats["in_flight"],
+            "workers": stats["workers"]
+        }
+
+    async def check(self) -> None:
+        """Run every check once and publish a new snapshot"""
+        checks = {
+            "mongodb": await self._check_mongo(),
+            "gemini": self._check_gemini(),
+            "executor": self._check_executor()
+        }
+        ready = checks["mongodb"]["status"] == "up" and checks["executor"]["status"] == "ok"
+
+        self._body = json.dumps({
+            "ready": ready,
+            "checked_at": datetime.utcnow().isoformat() + "Z",
+            "checks": checks
+        }).encode()
+        self._ready = ready
+        self._checked_at = time.monotonic()
+
+    async def run(self) -> None:
+        """Background loop refreshing the snapshot every interval"""
+        while True:
+            try:
+                await self.check()
+            except Exception as e:
+                print(f"Health check failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def readiness(self) -> Tuple[bool, bytes]:
+        """Whether the worker is ready, and the JSON snapshot behind the answer"""
+        fresh = time.monotonic() - self._checked_at < 3 * self.interval
+        return self._ready and fresh, self._body
+
+    def mongo_status(self) -> Optional[bool]:
+        """Last observed MongoDB reachability (None before the first check)"""
+        return self._mongo_up
+
+
+health_checker = HealthChecker(HEALTH_CHECK_INTERVAL, HEALTH_CHECK_TIMEOUT)
@@ -0,0 +1,79 @@
+import asyncio
+import math
+import threading
+from collections import deque
+from typing import Awaitable, Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class LatencyTracker:
+    """Rolling window of call latencies (seconds) for percentile estimates"""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, fraction: float, min_samples: int = 1) -> Optional[float]:
+        """The given percentile, or None if fewer than min_samples were recorded"""
+        with self._lock:
+            if len(self._samples) < max(min_samples, 1):
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(math.ceil(fraction * len(ordered)) - 1, len(ordered) - 1)]
+
+
+async def hedged(call: Callable[[threading.Event], Awaitable[Optional[T]]], delay: float) -> Optional[T]:
+    """
+    Run a call, starting an identical backup if it has not finished after `delay`
+
+    The first non-None result wins and the other call is cancelled. Calls
+    receive a threading.Event that is set once they lose, so work running on
+    an executor thread can stop at its next checkpoint.
+
+    Cancellation cannot interrupt a blocking call already in progress: a
+    losing call on the executor keeps its worker thread, and whatever
+    upstream quota it uses, until that call returns. Only the attempts it
+    would have made afterwards are skipped.
+
+    Args:
+        call: Factory starting one attempt; returns None on failure
+        delay: Seconds to wait before starting the backup
+
+    Returns:
+        The first non-None result, or None if both calls failed
+
+    Raises:
+        Exception: The first call's exception, if every call raised
+    """
+    cancel_events = [threading.Event()]
+    primary = asyncio.ensure_future(call(cancel_events[0]))
+    done, _ = await asyncio.wait({primary}, timeout=delay)
+    if done:
+        return primary.result()
+
+    cancel_events.append(threading.Event())
+    backup = asyncio.ensure_future(call(cancel_events[1]))
+    tasks = {primary: cancel_events[0], backup: cancel_events[1]}
+    pending = set(tasks)
+    errors = []
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    errors.append(task.exception())
+                elif task.result() is not None:
+                    return task.result()
+    finally:
+        for task in pending:
+            tasks[task].set()
+            task.cancel()
+
+    if len(errors) == len(tasks):
+        raise errors[0]
+    return None
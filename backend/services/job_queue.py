@@ -0,0 +1,165 @@
+import asyncio
+import os
+import secrets
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+from database import create_job, claim_job, finish_job, get_claimable_job_ids, release_job
+from dependencies import load_user_context
+from services.generation import GenerationError, run_generation
+from services.rate_limiter import admission
+
+# Generations executed concurrently by this worker's job pool
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "8"))
+# Jobs waiting in memory before new submissions are rejected (back-pressure)
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))
+# A running job whose lease expires is assumed abandoned and is picked up again
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "600"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# How often to look for queued or abandoned jobs persisted in MongoDB
+JOB_RECOVERY_INTERVAL = float(os.getenv("JOB_RECOVERY_INTERVAL", "30"))
+JOB_RETENTION_HOURS = int(os.getenv("JOB_RETENTION_HOURS", "168"))
+
+
+class QueueFullError(Exception):
+    """The job queue is at capacity; the client should retry later"""
+
+
+class JobQueue:
+    """
+    Bounded worker pool executing generation jobs persisted in MongoDB
+
+    Jobs are stored before they are queued and claimed under a lease before
+    they run, so jobs survive restarts and are never run by two workers
+    at once.
+    """
+
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._pending: Set[str] = set()
+        self._tasks: List[asyncio.Task] = []
+        # Jobs this worker is running, with the lease it claimed them under
+        self._claimed: Dict[str, datetime] = {}
+
+    async def start(self) -> None:
+        """Start the worker pool and the recovery loop"""
+        self._queue = asyncio.Queue(maxsize=JOB_QUEUE_SIZE)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(JOB_WORKERS)]
+        self._tasks.append(asyncio.create_task(self._recover()))
+
+    async def stop(self) -> None:
+        """
+        Stop workers, putting the jobs they were running back in the queue
+
+        Released jobs can be picked up at once by another worker (or this
+        one after a restart) instead of waiting for their lease to expire.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        for job_id, lease_expires_at in list(self._claimed.items()):
+            try:
+                await release_job(job_id, lease_expires_at)
+            except Exception as e:
+                print(f"Releasing job {job_id} failed: {e}")
+        self._claimed.clear()
+
+    async def submit(self, user_email: str, prompt: str, use_cache: bool = True) -> str:
+        """
+        Persist and enqueue a generation job
+
+        Returns:
+            The new job ID
+
+        Raises:
+            QueueFullError: If the queue is at capacity
+        """
+        if self._queue is None or self._queue.full():
+            raise QueueFullError()
+
+        job_id = secrets.token_urlsafe(16)
+        await create_job(job_id, user_email, prompt, use_cache, retention_hours=JOB_RETENTION_HOURS)
+        self._enqueue(job_id)
+        return job_id
+
+    def _enqueue(self, job_id: str) -> bool:
+        if job_id in self._pending:
+            return True
+        try:
+            self._queue.put_nowait(job_id)
+        except asyncio.QueueFull:
+            return False
+        self._pending.add(job_id)
+        return True
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            self._pending.discard(job_id)
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                print(f"Job {job_id} crashed: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str) -> None:
+        job = await claim_job(job_id, JOB_LEASE_SECONDS)
+        if job is None:
+            return  # Finished, or claimed by another worker
+
+        if job["attempts"] > JOB_MAX_ATTEMPTS:
+            await finish_job(job_id, "failed", error=f"Job abandoned after {JOB_MAX_ATTEMPTS} attempts")
+            return
+
+        self._claimed[job_id] = job["lease_expires_at"]
+        try:
+            await self._execute(job_id, job)
+        except asyncio.CancelledError:
+            # Still claimed, so stop() puts the job back in the queue
+            raise
+        except Exception:
+            del self._claimed[job_id]
+            raise
+        del self._claimed[job_id]
+
+    async def _execute(self, job_id: str, job: dict) -> None:
+        try:
+            user = await load_user_context({"user_email": job["user_email"]})
+            if not user:
+                raise GenerationError("No OAuth token found. Please re-authenticate.")
+
+            # Jobs share the worker's generation slots with interactive requests,
+            # but queue for one instead of timing out
+            async with admission.admit(wait_indefinitely=True):
+                response = await run_generation(user, job["prompt"], use_cache=job["use_cache"])
+            await finish_job(job_id, "succeeded", result=response.model_dump())
+        except GenerationError as e:
+            await finish_job(job_id, "failed", error=str(e))
+        except Exception as e:
+            await finish_job(job_id, "failed", error=f"Form generation failed: {str(e)}")
+
+    async def _recover(self) -> None:
+        """Enqueue persisted jobs that are waiting or were abandoned by a dead worker"""
+        while True:
+            try:
+                room = self._queue.maxsize - self._queue.qsize()
+                if room > 0:
+                    for job_id in await get_claimable_job_ids(limit=room):
+                        if not self._enqueue(job_id):
+                            break
+            except Exception as e:
+                print(f"Job recovery failed: {e}")
+            await asyncio.sleep(JOB_RECOVERY_INTERVAL)
+
+    def stats(self) -> dict:
+        """Queue depth and capacity"""
+        return {
+            "workers": JOB_WORKERS,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "capacity": JOB_QUEUE_SIZE
+        }
+
+
+job_queue = JobQueue()
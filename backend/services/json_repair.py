@@ -0,0 +1,88 @@
+import re
+from typing import List, Optional, Tuple
+
+_FENCE = re.compile(r"^```[a-zA-Z]*\s*|\s*```$")
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+def repair_json(text: str) -> Optional[str]:
+    """
+    Apply cheap local fixes to almost-valid model JSON
+
+    Handles the failure modes seen in practice: markdown code fences or
+    prose around the object, trailing commas, and output truncated at the
+    token limit (cut back to the last complete value and closed).
+
+    Args:
+        text: Raw model output
+
+    Returns:
+        Repaired JSON text, or None if there is no JSON object to repair
+    """
+    text = _FENCE.sub("", text.strip())
+    start = text.find("{")
+    if start < 0:
+        return None
+    text = text[start:]
+
+    cleaned, cut_points, stack = _scan(text)
+    if stack:
+        if not cut_points:
+            return None
+        # Truncated: drop the partial trailing value and close what is still open
+        end, stack = cut_points[-1]
+        cleaned = cleaned[:end].rstrip().rstrip(",")
+    else:
+        # Complete: ignore anything after the top-level object
+        cleaned = cleaned[:cut_points[-1][0]]
+
+    return cleaned + "".join(_CLOSERS[opener] for opener in reversed(stack))
+
+
+def _scan(text: str) -> Tuple[str, List[Tuple[int, List[str]]], List[str]]:
+    """
+    Drop trailing commas and record where complete values end
+
+    Returns:
+        (text without trailing commas, [(end offset, open brackets there)], open brackets at the end)
+    """
+    out: List[str] = []
+    stack: List[str] = []
+    cut_points: List[Tuple[int, List[str]]] = []
+    in_string = False
+    escape = False
+
+    for char in text:
+        if in_string:
+            out.append(char)
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+                if stack and stack[-1] == "[":
+                    cut_points.append((len(out), list(stack)))
+            continue
+
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append(char)
+        elif char in "}]":
+            # A comma directly before a closer is a trailing comma
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+            if stack:
+                stack.pop()
+            out.append(char)
+            cut_points.append((len(out), list(stack)))
+            if not stack:
+                break
+            continue
+
+        out.append(char)
+
+    return "".join(out), cut_points, stack
@@ -0,0 +1,129 @@
+import os
+import re
+import threading
+from collections import defaultdict
+from typing import Any, Dict, NamedTuple, Optional
+from services.hedging import LatencyTracker
+
+# Model tiers
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+GEMINI_FAST_MODEL = os.getenv("GEMINI_FAST_MODEL", "gemini-2.5-flash-lite")
+# Used when the routed model times out or is out of quota ("" disables fallback)
+GEMINI_FALLBACK_MODEL = os.getenv("GEMINI_FALLBACK_MODEL", "gemini-2.0-flash")
+
+# Prompts this short asking for this few questions go to the fast tier
+FAST_MAX_PROMPT_CHARS = int(os.getenv("GEMINI_FAST_MAX_PROMPT_CHARS", "300"))
+FAST_MAX_QUESTIONS = int(os.getenv("GEMINI_FAST_MAX_QUESTIONS", "10"))
+
+# Output budget: the estimated schema size with 2x headroom, rounded up to a
+# power of two, never below the tier minimum (2.5 models spend part of the
+# budget on thinking) nor above the model limit
+FAST_MIN_OUTPUT_TOKENS = 4096
+STANDARD_MIN_OUTPUT_TOKENS = 8192
+MAX_OUTPUT_TOKENS = int(os.getenv("GEMINI_MAX_OUTPUT_TOKENS", "65536"))
+TOKENS_PER_QUESTION = 100
+SCHEMA_BASE_TOKENS = 200
+DEFAULT_QUESTIONS = 8
+
+_QUESTION_COUNT = re.compile(r"\b(\d{1,3})\s+(?:[a-z-]+\s+){0,2}(?:questions?|fields?|items?)\b", re.IGNORECASE)
+
+
+class ModelRoute(NamedTuple):
+    """Model and output budget chosen for one prompt"""
+    model_name: str
+    max_output_tokens: int
+    estimated_questions: int
+
+
+def estimate_questions(prompt: str) -> int:
+    """
+    Estimate how many questions a prompt asks for
+
+    Uses an explicit count ("20 questions", "5 short fields") when present,
+    otherwise scales with the prompt's length and list separators.
+    """
+    counts = [int(match) for match in _QUESTION_COUNT.findall(prompt)]
+    if counts:
+        return max(counts)
+    separators = prompt.count(",") + prompt.count("\n") + prompt.count(";")
+    return max(DEFAULT_QUESTIONS, separators + 1, len(prompt) // 80)
+
+
+def _output_budget(questions: int, minimum: int) -> int:
+    needed = 2 * (SCHEMA_BASE_TOKENS + questions * TOKENS_PER_QUESTION)
+    budget = minimum
+    while budget < needed:
+        budget *= 2
+    return min(budget, MAX_OUTPUT_TOKENS)
+
+
+def route_prompt(prompt: str) -> ModelRoute:
+    """Pick the model tier and output budget for a prompt"""
+    questions = estimate_questions(prompt)
+    if len(prompt) <= FAST_MAX_PROMPT_CHARS and questions <= FAST_MAX_QUESTIONS:
+        return ModelRoute(GEMINI_FAST_MODEL, _output_budget(questions, FAST_MIN_OUTPUT_TOKENS), questions)
+    return ModelRoute(GEMINI_MODEL, _output_budget(questions, STANDARD_MIN_OUTPUT_TOKENS), questions)
+
+
+def fallback_model(model_name: str) -> Optional[str]:
+    """Model to retry with when model_name times out or runs out of quota"""
+    if GEMINI_FALLBACK_MODEL and GEMINI_FALLBACK_MODEL != model_name:
+        return GEMINI_FALLBACK_MODEL
+    return None
+
+
+class ModelStats:
+    """Per-model call, latency and token accounting"""
+
+    def __init__(self):
+        self.calls = 0
+        self.failures = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.latency = LatencyTracker()
+
+
+_model_stats: Dict[str, ModelStats] = defaultdict(ModelStats)
+_model_stats_lock = threading.Lock()
+
+
+def record_model_call(model_name: str, latency: float, usage: Any = None, success: bool = True) -> None:
+    """
+    Account one model call
+
+    Args:
+        model_name: Model that served the call
+        latency: Wall time of the call in seconds
+        usage: The response's usage_metadata, if any
+        success: Whether the call returned a response
+    """
+    with _model_stats_lock:
+        stats = _model_stats[model_name]
+        stats.calls += 1
+        if not success:
+            stats.failures += 1
+        if usage is not None:
+            stats.prompt_tokens += getattr(usage, "prompt_token_count", 0) or 0
+            stats.output_tokens += getattr(usage, "candidates_token_count", 0) or 0
+    if success:
+        stats.latency.record(latency)
+
+
+def model_stats() -> Dict[str, Dict[str, Any]]:
+    """Calls, failures, latency percentiles (ms) and token totals per model"""
+    with _model_stats_lock:
+        snapshot = list(_model_stats.items())
+
+    report = {}
+    for model_name, stats in snapshot:
+        p50 = stats.latency.percentile(0.5)
+        p95 = stats.latency.percentile(0.95)
+        report[model_name] = {
+            "calls": stats.calls,
+            "failures": stats.failures,
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "prompt_tokens": stats.prompt_tokens,
+            "output_tokens": stats.output_tokens
+        }
+    return report
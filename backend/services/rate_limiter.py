@@ -0,0 +1,256 @@
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from cache import TTLCache
+from database import consume_rate_limit_token, refund_rate_limit_token
+from services.gemini_service import GEMINI_API_KEY
+
+# Bucket storage: "memory" (per worker), "mongo" (shared by all workers) or "none"
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+
+# Generations per user per minute, and how many may be made back to back
+USER_RATE_PER_MINUTE = float(os.getenv("USER_RATE_PER_MINUTE", "10"))
+USER_BURST = float(os.getenv("USER_BURST", "5"))
+# Gemini calls per minute on the shared default key (all users together)...
+DEFAULT_KEY_RATE_PER_MINUTE = float(os.getenv("GEMINI_DEFAULT_KEY_RATE_PER_MINUTE", "60"))
+DEFAULT_KEY_BURST = float(os.getenv("GEMINI_DEFAULT_KEY_BURST", "20"))
+# ...and on each user's own key from their settings
+USER_KEY_RATE_PER_MINUTE = float(os.getenv("GEMINI_USER_KEY_RATE_PER_MINUTE", "15"))
+USER_KEY_BURST = float(os.getenv("GEMINI_USER_KEY_BURST", "15"))
+
+# Generations running at once on this worker; more wait up to ADMISSION_TIMEOUT
+ADMISSION_CONCURRENCY = int(os.getenv("ADMISSION_CONCURRENCY", "16"))
+ADMISSION_TIMEOUT = float(os.getenv("ADMISSION_TIMEOUT", "10"))
+
+
+class RateLimitExceeded(Exception):
+    """A token bucket is empty; the client should retry after `retry_after` seconds"""
+
+    def __init__(self, scope: str, retry_after: float):
+        super().__init__(f"Rate limit exceeded for {scope}. Please retry in {retry_after:.0f}s.")
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+class AdmissionTimeoutError(Exception):
+    """The worker stayed at capacity for the whole admission wait"""
+
+
+class RateLimiter:
+    """
+    Base token-bucket limiter: allows everything
+
+    A request costing more than the bucket's burst (a large batch) is let
+    through when the bucket is full and leaves it in debt, so it is paid
+    back before the next request instead of never fitting.
+    """
+
+    async def consume(self, key: str, rate: float, burst: float, cost: float = 1) -> float:
+        """
+        Take `cost` tokens from a bucket
+
+        Args:
+            key: Bucket identifier
+            rate: Refill rate in tokens per second
+            burst: Bucket capacity
+            cost: Tokens this request needs
+
+        Returns:
+            0 if allowed, otherwise seconds until enough tokens are available
+        """
+        return 0.0
+
+    async def refund(self, key: str, rate: float, burst: float, cost: float = 1) -> None:
+        """Give back tokens taken by consume for a request that was then rejected elsewhere"""
+
+    @staticmethod
+    def _wait_time(tokens: float, rate: float, burst: float, cost: float) -> float:
+        return (min(cost, burst) - tokens) / rate
+
+
+class MemoryRateLimiter(RateLimiter):
+    """Per-worker token buckets"""
+
+    def __init__(self, maxsize: int = 100_000):
+        self._buckets = TTLCache(maxsize=maxsize, ttl=3600)
+        self._lock = threading.Lock()
+
+    async def consume(self, key: str, rate: float, burst: float, cost: float = 1) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            allowed = tokens >= min(cost, burst)
+            if allowed:
+                tokens -= cost
+            self._buckets.set(key, (tokens, now), ttl=burst / rate + 60)
+        return 0.0 if allowed else self._wait_time(tokens, rate, burst, cost)
+
+    async def refund(self, key: str, rate: float, burst: float, cost: float = 1) -> None:
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                return
+            tokens, updated = bucket
+            tokens = min(burst, tokens + (now - updated) * rate + cost)
+            self._buckets.set(key, (tokens, now), ttl=burst / rate + 60)
+
+
+class MongoRateLimiter(RateLimiter):
+    """Token buckets shared by all workers, updated atomically in MongoDB"""
+
+    async def consume(self, key: str, rate: float, burst: float, cost: float = 1) -> float:
+        allowed, tokens = await consume_rate_limit_token(key, rate, burst, cost)
+        return 0.0 if allowed else self._wait_time(tokens, rate, burst, cost)
+
+    async def refund(self, key: str, rate: float, burst: float, cost: float = 1) -> None:
+        await refund_rate_limit_token(key, burst, cost)
+
+
+def _create_rate_limiter() -> RateLimiter:
+    if RATE_LIMIT_BACKEND == "mongo":
+        return MongoRateLimiter()
+    if RATE_LIMIT_BACKEND == "memory":
+        return MemoryRateLimiter()
+    return RateLimiter()
+
+
+rate_limiter = _create_rate_limiter()
+
+
+def _key_bucket(api_key: Optional[str]) -> Tuple[str, float, float]:
+    """Bucket name, rate (per second) and burst for a Gemini key"""
+    if api_key and api_key != GEMINI_API_KEY:
+        key_hash = hashlib.sha256(api_key.encode()).hexdigest()[:16]
+        return f"gemini:{key_hash}", USER_KEY_RATE_PER_MINUTE / 60, USER_KEY_BURST
+    return "gemini:default", DEFAULT_KEY_RATE_PER_MINUTE / 60, DEFAULT_KEY_BURST
+
+
+def _buckets(user_email: str, api_key: Optional[str]) -> List[Tuple[str, str, float, float]]:
+    """(scope, bucket name, rate, burst) of the user's bucket and the Gemini key's bucket"""
+    key_bucket, key_rate, key_burst = _key_bucket(api_key)
+    return [
+        ("user", f"user:{user_email}", USER_RATE_PER_MINUTE / 60, USER_BURST),
+        ("Gemini API key", key_bucket, key_rate, key_burst)
+    ]
+
+
+async def _refund(charged: List[Tuple[str, float, float, float]]) -> None:
+    for key, rate, burst, cost in charged:
+        try:
+            await rate_limiter.refund(key, rate, burst, cost)
+        except Exception as e:
+            print(f"Rate limiter refund failed: {e}")
+
+
+async def check_rate_limits(user_email: str, api_key: Optional[str], cost: int = 1, key_cost: Optional[int] = None) -> None:
+    """
+    Charge a request against the user's bucket and the Gemini key's bucket
+
+    A request rejected by one bucket is refunded to the buckets already
+    charged. A limiter backend failure skips that bucket rather than
+    failing the request.
+
+    Only the user's bucket may go into debt for a request costing more than
+    its burst. Key buckets are shared, so a batch charges its key one
+    prompt at a time as each starts (key_cost=0 here, then cost=0,
+    key_cost=1 per prompt) instead of draining it for every other user.
+
+    Args:
+        user_email: User making the request
+        api_key: The user's own Gemini key, or None for the shared default key
+        cost: Number of generations charged to the user
+        key_cost: Gemini calls charged to the key (defaults to cost)
+
+    Raises:
+        RateLimitExceeded: If either bucket is empty
+    """
+    charged = []
+    costs = [cost, cost if key_cost is None else key_cost]
+    for (scope, key, rate, burst), amount in zip(_buckets(user_email, api_key), costs):
+        if amount <= 0:
+            continue
+        try:
+            retry_after = await rate_limiter.consume(key, rate, burst, amount)
+        except Exception as e:
+            print(f"Rate limiter unavailable: {e}")
+            continue
+        if retry_after > 0:
+            await _refund(charged)
+            raise RateLimitExceeded(scope, retry_after)
+        charged.append((key, rate, burst, amount))
+
+
+async def refund_rate_limits(user_email: str, api_key: Optional[str], cost: int = 1, key_cost: Optional[int] = None) -> None:
+    """Give back what check_rate_limits charged, for a request that was then not served"""
+    costs = [cost, cost if key_cost is None else key_cost]
+    await _refund([
+        (key, rate, burst, amount)
+        for (_, key, rate, burst), amount in zip(_buckets(user_email, api_key), costs)
+        if amount > 0
+    ])
+
+
+class AdmissionController:
+    """
+    Caps concurrent generations on this worker
+
+    Every generation takes its own slot: each prompt of a batch and each
+    background job as well as single requests.
+
+    Requests over the cap queue for a free slot, but only up to `timeout`
+    seconds, so latency stays bounded instead of piling up behind a slow
+    upstream.
+    """
+
+    def __init__(self, limit: int, timeout: float):
+        self.limit = limit
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(limit)
+        self._running = 0
+        self._waiting = 0
+        self._rejected = 0
+
+    @asynccontextmanager
+    async def admit(self, wait_indefinitely: bool = False) -> AsyncIterator[None]:
+        """
+        Hold a generation slot for the duration of the block
+
+        Args:
+            wait_indefinitely: Queue for a slot without the timeout (background jobs)
+
+        Raises:
+            AdmissionTimeoutError: If no slot frees up within the timeout
+        """
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), None if wait_indefinitely else self.timeout)
+        except asyncio.TimeoutError:
+            self._rejected += 1
+            raise AdmissionTimeoutError()
+        finally:
+            self._waiting -= 1
+
+        self._running += 1
+        try:
+            yield
+        finally:
+            self._running -= 1
+            self._semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "running": self._running,
+            "waiting": self._waiting,
+            "rejected": self._rejected,
+            "rate_limit_backend": RATE_LIMIT_BACKEND
+        }
+
+
+admission = AdmissionController(ADMISSION_CONCURRENCY, ADMISSION_TIMEOUT)
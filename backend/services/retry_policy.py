@@ -0,0 +1,111 @@
+import os
+import random
+import re
+from typing import Optional
+
+# Gemini call retry policy (seconds)
+GEMINI_MAX_ATTEMPTS = int(os.getenv("GEMINI_MAX_ATTEMPTS", "3"))
+GEMINI_RETRY_BASE_DELAY = float(os.getenv("GEMINI_RETRY_BASE_DELAY", "0.5"))
+GEMINI_RETRY_MAX_DELAY = float(os.getenv("GEMINI_RETRY_MAX_DELAY", "8"))
+# Overall budget for one schema generation, across all attempts
+GEMINI_DEADLINE = float(os.getenv("GEMINI_DEADLINE", "90"))
+# Budget for a single call, so a timed-out attempt leaves time to retry or fall back
+GEMINI_ATTEMPT_TIMEOUT = float(os.getenv("GEMINI_ATTEMPT_TIMEOUT", "40"))
+
+# Error classes
+AUTH = "auth"
+QUOTA = "quota"
+TIMEOUT = "timeout"
+SAFETY = "safety"
+INVALID = "invalid"
+TRANSIENT = "transient"
+
+RETRYABLE = {QUOTA, TIMEOUT, TRANSIENT}
+
+_RETRY_IN = re.compile(r"retry in (\d+(?:\.\d+)?)\s*s", re.IGNORECASE)
+
+
+class SafetyBlockedError(Exception):
+    """Gemini refused to answer the prompt (safety or policy block)"""
+
+
+def classify_error(error: Exception) -> str:
+    """
+    Classify a Gemini call failure
+
+    Auth, safety and invalid-request failures are fatal: repeating the same
+    request cannot succeed. Quota, timeout and transient server/network
+    failures are retryable.
+    """
+    if isinstance(error, SafetyBlockedError):
+        return SAFETY
+    from google.api_core import exceptions as google_exceptions
+
+    if isinstance(error, (google_exceptions.Unauthenticated, google_exceptions.PermissionDenied)):
+        return AUTH
+    if isinstance(error, google_exceptions.TooManyRequests):
+        return QUOTA
+    if isinstance(error, (google_exceptions.DeadlineExceeded, TimeoutError)):
+        return TIMEOUT
+    if isinstance(error, (google_exceptions.InvalidArgument, google_exceptions.NotFound, google_exceptions.BadRequest)):
+        return INVALID
+    if isinstance(error, ValueError) and "API key" in str(error):
+        return AUTH
+    return TRANSIENT
+
+
+def retry_after_hint(error: Exception) -> Optional[float]:
+    """
+    Server-suggested wait before retrying, in seconds, if the error carries one
+
+    Reads google.rpc.RetryInfo from the error details, falling back to the
+    "Please retry in Ns" text Gemini puts in quota messages.
+    """
+    for detail in getattr(error, "details", None) or ():
+        retry_delay = getattr(detail, "retry_delay", None)
+        if retry_delay is not None and (retry_delay.seconds or retry_delay.nanos):
+            return retry_delay.seconds + retry_delay.nanos / 1e9
+
+    match = _RETRY_IN.search(str(error))
+    return float(match.group(1)) if match else None
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter, bounded by an overall deadline
+
+    Args:
+        max_attempts: Model calls allowed per generation
+        base_delay: Backoff before the second attempt (doubles each time)
+        max_delay: Upper bound on a single backoff
+        deadline: Total time budget for all attempts
+        attempt_timeout: Time budget for one attempt (capped by what is left of the deadline)
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = GEMINI_MAX_ATTEMPTS,
+        base_delay: float = GEMINI_RETRY_BASE_DELAY,
+        max_delay: float = GEMINI_RETRY_MAX_DELAY,
+        deadline: float = GEMINI_DEADLINE,
+        attempt_timeout: float = GEMINI_ATTEMPT_TIMEOUT
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        Delay before the attempt following `attempt` (1-based)
+
+        A server retry-after hint is honoured as a lower bound.
+        """
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+
+default_retry_policy = RetryPolicy()
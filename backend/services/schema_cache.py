@@ -0,0 +1,296 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Optional, Tuple, Union
+from cache import TTLCache
+from database import get_cached_schema, save_cached_schema
+from executor import iterate_blocking, run_blocking
+from models import FormQuestion, FormSchema, GenerationUsage
+from services.gemini_service import (
+    GEMINI_API_KEY, GEMINI_MODEL, GENERATION_CONFIG, SYSTEM_INSTRUCTION,
+    generate_form_schema, load_form_schema, stream_form_schema_text
+)
+from services.circuit_breaker import CLOSED, get_breaker
+from services.hedging import LatencyTracker, hedged
+from services.model_router import route_prompt
+from services.retry_policy import RETRYABLE, classify_error
+from services.stream_parser import QuestionStreamParser
+
+# Cache backend: "memory" (per worker), "mongo" (shared by all workers) or "none"
+SCHEMA_CACHE_BACKEND = os.getenv("SCHEMA_CACHE_BACKEND", "memory")
+SCHEMA_CACHE_SIZE = int(os.getenv("SCHEMA_CACHE_SIZE", "1024"))
+SCHEMA_CACHE_TTL = float(os.getenv("SCHEMA_CACHE_TTL", "86400"))
+
+# Hedged requests: if a generation is slower than the recent p95, start a
+# second identical one and keep whichever finishes first (costs extra tokens)
+GEMINI_HEDGE = os.getenv("GEMINI_HEDGE", "false").lower() == "true"
+GEMINI_HEDGE_PERCENTILE = float(os.getenv("GEMINI_HEDGE_PERCENTILE", "0.95"))
+GEMINI_HEDGE_MIN_SAMPLES = int(os.getenv("GEMINI_HEDGE_MIN_SAMPLES", "20"))
+# Hedge delay used until enough latencies are recorded, and its lower bound
+GEMINI_HEDGE_DELAY = float(os.getenv("GEMINI_HEDGE_DELAY", "15"))
+GEMINI_HEDGE_MIN_DELAY = float(os.getenv("GEMINI_HEDGE_MIN_DELAY", "1"))
+
+_SYSTEM_INSTRUCTION_HASH = hashlib.sha256(SYSTEM_INSTRUCTION.encode()).hexdigest()
+_generation_latency = LatencyTracker()
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Case-fold and collapse whitespace so trivially different prompts share an entry"""
+    return " ".join(prompt.casefold().split())
+
+
+def schema_cache_key(prompt: str, model_name: str = GEMINI_MODEL, generation_config: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Content address of a generation request
+
+    Covers everything that determines the model output: the normalized
+    prompt, model name, generation config and system instruction.
+    """
+    material = {
+        "prompt": normalize_prompt(prompt),
+        "model": model_name,
+        "generation_config": generation_config if generation_config is not None else GENERATION_CONFIG,
+        "system_instruction": _SYSTEM_INSTRUCTION_HASH
+    }
+    return hashlib.sha256(json.dumps(material, sort_keys=True).encode()).hexdigest()
+
+
+def routed_cache_key(prompt: str) -> str:
+    """Cache key for a prompt under the model and output budget the router picks for it"""
+    route = route_prompt(prompt)
+    generation_config = {**GENERATION_CONFIG, "max_output_tokens": route.max_output_tokens}
+    return schema_cache_key(prompt, model_name=route.model_name, generation_config=generation_config)
+
+
+class SchemaCache:
+    """Base schema cache: counts hits and misses, stores nothing"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> Optional[FormSchema]:
+        schema = await self._get(key)
+        if schema is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return schema
+
+    async def set(self, key: str, schema: FormSchema) -> None:
+        await self._set(key, schema)
+
+    async def _get(self, key: str) -> Optional[FormSchema]:
+        return None
+
+    async def _set(self, key: str, schema: FormSchema) -> None:
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "backend": SCHEMA_CACHE_BACKEND,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+
+class MemorySchemaCache(SchemaCache):
+    """In-process LRU schema cache"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        super().__init__()
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def _get(self, key: str) -> Optional[FormSchema]:
+        return self._cache.get(key)
+
+    async def _set(self, key: str, schema: FormSchema) -> None:
+        self._cache.set(key, schema)
+
+
+class MongoSchemaCache(SchemaCache):
+    """Schema cache shared by all workers, expired by a TTL index"""
+
+    def __init__(self, ttl: float):
+        super().__init__()
+        self.ttl = ttl
+
+    async def _get(self, key: str) -> Optional[FormSchema]:
+        schema = await get_cached_schema(key)
+        return FormSchema.model_validate(schema) if schema else None
+
+    async def _set(self, key: str, schema: FormSchema) -> None:
+        await save_cached_schema(key, schema.model_dump(), self.ttl)
+
+
+def _create_schema_cache() -> SchemaCache:
+    if SCHEMA_CACHE_BACKEND == "mongo":
+        return MongoSchemaCache(ttl=SCHEMA_CACHE_TTL)
+    if SCHEMA_CACHE_BACKEND == "memory":
+        return MemorySchemaCache(maxsize=SCHEMA_CACHE_SIZE, ttl=SCHEMA_CACHE_TTL)
+    return SchemaCache()
+
+
+schema_cache = _create_schema_cache()
+
+
+async def _lookup(key: str) -> Optional[FormSchema]:
+    try:
+        return await schema_cache.get(key)
+    except Exception as e:
+        print(f"Schema cache lookup failed: {e}")
+        return None
+
+
+async def _store(key: str, form_schema: Optional[FormSchema]) -> None:
+    if form_schema is None:
+        return
+    try:
+        await schema_cache.set(key, form_schema)
+    except Exception as e:
+        print(f"Schema cache store failed: {e}")
+
+
+def hedge_delay() -> float:
+    """Seconds to wait before hedging: the recent latency percentile, once known"""
+    delay = _generation_latency.percentile(GEMINI_HEDGE_PERCENTILE, min_samples=GEMINI_HEDGE_MIN_SAMPLES)
+    return max(delay if delay is not None else GEMINI_HEDGE_DELAY, GEMINI_HEDGE_MIN_DELAY)
+
+
+async def generate_schema(
+    prompt: str,
+    api_key: Optional[str] = None,
+    usage: Optional[GenerationUsage] = None
+) -> Optional[FormSchema]:
+    """
+    Generate a schema with Gemini on the executor, hedging slow calls if enabled
+
+    Hedging only happens while the breaker for the key is closed, so a
+    degraded upstream is not hit with duplicate traffic. A losing hedge
+    whose Gemini call is already in flight still runs it to completion on
+    the executor; its tokens are counted in `usage` only if that call
+    finished before this returns.
+    """
+    attempt_usages = []
+
+    async def attempt(cancelled: threading.Event) -> Optional[FormSchema]:
+        attempt_usage = GenerationUsage()
+        attempt_usages.append(attempt_usage)
+        started = time.perf_counter()
+        form_schema = await run_blocking(
+            generate_form_schema, prompt, api_key=api_key, cancelled=cancelled, usage=attempt_usage
+        )
+        if form_schema is not None:
+            _generation_latency.record(time.perf_counter() - started)
+            if usage is not None:
+                usage.model = attempt_usage.model
+        return form_schema
+
+    try:
+        breaker = get_breaker(route_prompt(prompt).model_name, api_key or GEMINI_API_KEY)
+        if not GEMINI_HEDGE or breaker.state != CLOSED:
+            return await attempt(threading.Event())
+        return await hedged(attempt, hedge_delay())
+    finally:
+        if usage is not None:
+            usage.prompt_tokens += sum(part.prompt_tokens for part in attempt_usages)
+            usage.output_tokens += sum(part.output_tokens for part in attempt_usages)
+            usage.model = usage.model or next((part.model for part in attempt_usages if part.model), None)
+
+
+async def get_form_schema(
+    prompt: str,
+    api_key: Optional[str] = None,
+    use_cache: bool = True,
+    usage: Optional[GenerationUsage] = None
+) -> Optional[FormSchema]:
+    """
+    Generate a form schema, serving identical requests from the cache
+
+    Args:
+        prompt: Natural language description of the form
+        api_key: Optional custom Gemini API key
+        use_cache: Set False to always call Gemini (the result is still cached)
+        usage: Receives the model, token counts and whether the cache served it
+
+    Returns:
+        FormSchema object or None if generation fails
+    """
+    key = routed_cache_key(prompt)
+
+    if use_cache:
+        cached = await _lookup(key)
+        if cached is not None:
+            if usage is not None:
+                usage.cached = True
+            return cached
+
+    form_schema = await generate_schema(prompt, api_key=api_key, usage=usage)
+    await _store(key, form_schema)
+    return form_schema
+
+
+async def stream_form_schema(
+    prompt: str,
+    api_key: Optional[str] = None,
+    use_cache: bool = True,
+    usage: Optional[GenerationUsage] = None
+) -> AsyncIterator[Tuple[str, Union[FormQuestion, Optional[FormSchema]]]]:
+    """
+    Generate a form schema, yielding each question as soon as it is complete
+
+    Yields ("question", FormQuestion) items followed by one final
+    ("schema", FormSchema or None). The final schema is parsed from the full
+    output exactly as in generate_form_schema. If the streamed output does
+    not parse, or the stream fails with a retryable error, it falls back to
+    the non-streaming path with its retries, yielding ("reset", None) first
+    if questions were already emitted. Auth, invalid-request and safety
+    failures end the generation, since a second call cannot succeed.
+
+    Args:
+        prompt: Natural language description of the form
+        api_key: Optional custom Gemini API key
+        use_cache: Set False to always call Gemini (the result is still cached)
+        usage: Receives the model, token counts and whether the cache served it
+    """
+    key = routed_cache_key(prompt)
+
+    if use_cache:
+        cached = await _lookup(key)
+        if cached is not None:
+            if usage is not None:
+                usage.cached = True
+            for question in cached.questions:
+                yield "question", question
+            yield "schema", cached
+            return
+
+    parser = QuestionStreamParser()
+    form_schema = None
+    try:
+        async for chunk in iterate_blocking(stream_form_schema_text, prompt, api_key=api_key, usage=usage):
+            for question in parser.feed(chunk):
+                yield "question", question
+        form_schema = load_form_schema(parser.text)
+    except Exception as e:
+        kind = classify_error(e)
+        if kind not in RETRYABLE:
+            print(f"Streaming generation failed ({kind} error): {e}")
+            yield "schema", None
+            return
+        print(f"Streaming generation failed, retrying without streaming: {e}")
+
+    if form_schema is None:
+        form_schema = await generate_schema(prompt, api_key=api_key, usage=usage)
+        if form_schema is not None:
+            if parser.questions:
+                yield "reset", None
+            for question in form_schema.questions:
+                yield "question", question
+
+    await _store(key, form_schema)
+    yield "schema", form_schema
@@ -0,0 +1,85 @@
+import json
+from typing import List, Optional
+from pydantic import ValidationError
+from models import FormQuestion
+
+
+class QuestionStreamParser:
+    """
+    Incrementally extracts questions from a streamed FormSchema JSON document
+
+    Feed it text chunks as they arrive; each question object inside the
+    top-level "questions" array is parsed and validated as soon as its
+    closing brace is seen. Text before the first '{' (such as a markdown
+    code fence) is ignored.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start: Optional[int] = None
+        self._last_string: Optional[str] = None
+        self._in_questions = False
+        self._question_start: Optional[int] = None
+        self.questions: List[FormQuestion] = []
+
+    def feed(self, chunk: str) -> List[FormQuestion]:
+        """
+        Consume a chunk of model output
+
+        Args:
+            chunk: Next piece of streamed text
+
+        Returns:
+            Questions completed by this chunk, in order
+        """
+        self.text += chunk
+        completed = []
+
+        while self._pos < len(self.text):
+            char = self.text[self._pos]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._last_string = self.text[self._string_start + 1:self._pos]
+            elif char == '"':
+                self._in_string = True
+                self._string_start = self._pos
+            elif char in "{[":
+                if char == "[" and self._depth == 1 and self._last_string == "questions":
+                    self._in_questions = True
+                elif char == "{" and self._in_questions and self._depth == 2:
+                    self._question_start = self._pos
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if char == "}" and self._question_start is not None and self._depth == 2:
+                    question = self._parse_question(self.text[self._question_start:self._pos + 1])
+                    self._question_start = None
+                    if question is not None:
+                        self.questions.append(question)
+                        completed.append(question)
+                elif char == "]" and self._in_questions and self._depth == 1:
+                    self._in_questions = False
+            elif self._depth == 1 and not char.isspace() and char not in ":,":
+                # A non-string value at the top level is never a key
+                self._last_string = None
+
+            self._pos += 1
+
+        return completed
+
+    @staticmethod
+    def _parse_question(raw: str) -> Optional[FormQuestion]:
+        try:
+            return FormQuestion.model_validate(json.loads(raw))
+        except (json.JSONDecodeError, ValidationError):
+            return None
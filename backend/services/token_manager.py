@@ -0,0 +1,149 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+from cache import TTLCache
+from database import update_oauth_access_token
+from executor import run_blocking
+from metrics import stage
+from services.auth_service import decrypt_token, encrypt_token, refresh_access_token, rotate_token
+
+# Refresh tokens this many seconds before they expire
+TOKEN_REFRESH_MARGIN = float(os.getenv("TOKEN_REFRESH_MARGIN", "300"))
+# How often the background refresher scans for tokens nearing expiry
+TOKEN_REFRESH_INTERVAL = float(os.getenv("TOKEN_REFRESH_INTERVAL", "60"))
+# Tokens of users idle for longer than this are dropped and no longer refreshed
+TOKEN_IDLE_TTL = float(os.getenv("TOKEN_IDLE_TTL", "3600"))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+
+
+class TokenManager:
+    """
+    Serves valid OAuth access tokens from memory and refreshes them ahead of expiry
+
+    Refreshes are single-flight per user: concurrent callers share one
+    in-progress refresh instead of each calling Google and racing on
+    the stored tokens.
+    """
+
+    def __init__(self):
+        self._tokens = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=TOKEN_IDLE_TTL)
+        self._refreshing: Dict[str, asyncio.Task] = {}
+
+    def remember(self, user_email: str, access_token: str, encrypted_refresh_token: str, expiry: datetime) -> None:
+        """Cache a freshly issued access token"""
+        previous = self._tokens.get(user_email)
+        self._tokens.set(user_email, {
+            "access_token": access_token,
+            "refresh_token": encrypted_refresh_token,
+            "expiry": expiry,
+            "last_used": previous["last_used"] if previous else datetime.utcnow()
+        }, ttl=self._idle_ttl_left(previous))
+
+    def _idle_ttl_left(self, entry: Optional[Dict[str, Any]]) -> float:
+        """Seconds until an entry counts as idle, so refreshes don't keep it alive"""
+        if entry is None:
+            return TOKEN_IDLE_TTL
+        return TOKEN_IDLE_TTL - (datetime.utcnow() - entry["last_used"]).total_seconds()
+
+    def forget(self, user_email: str) -> None:
+        """
+        Drop a user's cached token (e.g. on logout)
+
+        A refresh still in flight is detached rather than cancelled, so callers
+        already waiting on it still get an answer, but it no longer caches
+        the token it obtains.
+        """
+        self._tokens.pop(user_email)
+        self._refreshing.pop(user_email, None)
+
+    async def get_access_token(self, user_email: str, token_data: Dict[str, Any]) -> str:
+        """
+        Get a valid access token for a user
+
+        Args:
+            user_email: User the token belongs to
+            token_data: Stored (encrypted) OAuth token document, used on a cache miss
+
+        Returns:
+            Decrypted access token
+        """
+        entry = self._tokens.get(user_email)
+        if entry is None or token_data["token_expiry"] > entry["expiry"]:
+            entry = {
+                "access_token": decrypt_token(token_data["access_token"]),
+                "refresh_token": token_data["refresh_token"],
+                "expiry": token_data["token_expiry"]
+            }
+        entry["last_used"] = datetime.utcnow()
+        self._tokens.set(user_email, entry)
+
+        remaining = (entry["expiry"] - datetime.utcnow()).total_seconds()
+
+        if remaining > TOKEN_REFRESH_MARGIN:
+            return entry["access_token"]
+
+        if remaining > 0:
+            # Still usable: refresh in the background and serve the current token
+            self._start_refresh(user_email, entry["refresh_token"])
+            return entry["access_token"]
+
+        return await asyncio.shield(self._start_refresh(user_email, entry["refresh_token"]))
+
+    def _start_refresh(self, user_email: str, encrypted_refresh_token: str) -> asyncio.Task:
+        """Start a refresh for a user, or join the one already in flight"""
+        task = self._refreshing.get(user_email)
+        if task is None:
+            task = asyncio.create_task(self._refresh(user_email, encrypted_refresh_token))
+            self._refreshing[user_email] = task
+            task.add_done_callback(lambda done: self._refresh_done(user_email, done))
+        return task
+
+    def _refresh_done(self, user_email: str, task: asyncio.Task) -> None:
+        if self._refreshing.get(user_email) is task:
+            del self._refreshing[user_email]
+        if not task.cancelled():
+            task.exception()  # Mark background failures as retrieved; already logged
+
+    async def _refresh(self, user_email: str, encrypted_refresh_token: str) -> str:
+        """Exchange the refresh token for a new access token and persist it"""
+        try:
+            with stage("token_refresh"):
+                refresh_token = decrypt_token(encrypted_refresh_token)
+                new_token_data = await run_blocking(refresh_access_token, refresh_token)
+
+                # Same refresh token, re-encrypted if it was under a previous SECRET_KEY
+                rotated_refresh_token = rotate_token(encrypted_refresh_token)
+
+                # Only overwrites tokens still holding this refresh token, so a
+                # logout or re-login while Google was answering wins
+                stored = await update_oauth_access_token(
+                    user_email=user_email,
+                    refresh_token=encrypted_refresh_token,
+                    access_token=encrypt_token(new_token_data["access_token"]),
+                    token_expiry=new_token_data["expiry"],
+                    new_refresh_token=rotated_refresh_token
+                )
+            if stored and self._refreshing.get(user_email) is asyncio.current_task():
+                self.remember(user_email, new_token_data["access_token"], rotated_refresh_token, new_token_data["expiry"])
+
+            return new_token_data["access_token"]
+        except Exception as e:
+            print(f"Token refresh failed for {user_email}: {e}")
+            raise
+
+    async def run_refresher(self) -> None:
+        """Background loop refreshing cached tokens that are about to expire"""
+        while True:
+            await asyncio.sleep(TOKEN_REFRESH_INTERVAL)
+            horizon = datetime.utcnow() + timedelta(seconds=TOKEN_REFRESH_MARGIN + TOKEN_REFRESH_INTERVAL)
+            for user_email, entry in self._tokens.items():
+                if entry["expiry"] < horizon:
+                    self._start_refresh(user_email, entry["refresh_token"])
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache counters and number of refreshes in flight"""
+        return {**self._tokens.stats(), "refreshing": len(self._refreshing)}
+
+
+token_manager = TokenManager()
@@ -11,6 +11,7 @@ from dotenv import load_dotenv
 sys.path.insert(0, os.path.dirname(__file__))
 
 from services.gemini_service import generate_form_schema, test_gemini_connection
+from services.model_router import GEMINI_FALLBACK_MODEL, GEMINI_FAST_MODEL, GEMINI_MODEL
 from models import FormSchema
 
 # Load environment variables
@@ -56,13 +57,19 @@ def test_gemini_api():
     print("Testing Gemini API Connection")
     print("=" * 60)
     
-    if test_gemini_connection():
-        print("✓ Gemini API connection successful")
-        return True
-    else:
-        print("❌ Gemini API connection failed")
-        print("Please check your GEMINI_API_KEY")
-        return False
+    # Every model the router may use must be reachable with this key
+    models = [GEMINI_FAST_MODEL, GEMINI_MODEL, GEMINI_FALLBACK_MODEL]
+    all_connected = True
+    for model_name in dict.fromkeys(model for model in models if model):
+        if test_gemini_connection(model_name):
+            print(f"✓ Gemini API connection successful ({model_name})")
+        else:
+            print(f"❌ Gemini API connection failed ({model_name})")
+            all_connected = False
+    
+    if not all_connected:
+        print("Please check your GEMINI_API_KEY and GEMINI_*_MODEL settings")
+    return all_connected
 
 
 def test_form_generation():
@@ -105,6 +112,46 @@ def test_form_generation():
     return all(results)
 
 
+def test_mongodb_connection():
+    """Test MongoDB connectivity through the sync database facade"""
+    print("\n" + "=" * 60)
+    print("Testing MongoDB Connection")
+    print("=" * 60)
+    
+    import database_sync
+    
+    if database_sync.verify_connection():
+        print("✓ MongoDB connection successful")
+        return True
+    else:
+        print("❌ MongoDB connection failed")
+        print("Please check your MONGODB_URI and that MongoDB is running")
+        return False
+
+
+def test_index_usage():
+    """Test that every hot query is served by an index (IXSCAN, never COLLSCAN)"""
+    print("\n" + "=" * 60)
+    print("Testing MongoDB Index Usage")
+    print("=" * 60)
+    
+    import database_sync
+    
+    database_sync.ensure_indexes()
+    plans = database_sync.explain_hot_queries()
+    
+    all_indexed = True
+    for query, stages in plans.items():
+        # MongoDB 8 reports single-key equality lookups as EXPRESS_IXSCAN
+        if any(stage.endswith("IXSCAN") for stage in stages) and "COLLSCAN" not in stages:
+            print(f"✓ {query}: {' <- '.join(stages)}")
+        else:
+            print(f"❌ {query}: {' <- '.join(stages)}")
+            all_indexed = False
+    
+    return all_indexed
+
+
 def test_pydantic_validation():
     """Test Pydantic model validation"""
     print("\n" + "=" * 60)
@@ -165,6 +212,8 @@ def main():
     
     tests = [
         ("Environment Configuration", test_env_configuration),
+        ("MongoDB Connection", test_mongodb_connection),
+        ("MongoDB Index Usage", test_index_usage),
         ("Gemini API Connection", test_gemini_api),
         ("Pydantic Validation", test_pydantic_validation),
         ("Form Generation", test_form_generation),
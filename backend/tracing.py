@@ -0,0 +1,207 @@
+import os
+import threading
+from contextlib import nullcontext
+from functools import wraps
+from typing import Any, Callable, Dict, Optional, Sequence
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Per-request traces (requires opentelemetry-sdk; spans are no-ops otherwise)
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+# Fraction of requests traced; spans inside a request follow its decision
+TRACE_SAMPLE_RATIO = float(os.getenv("TRACE_SAMPLE_RATIO", "0.1"))
+# "file" (one OTLP/JSON batch per line in TRACE_FILE) or "console"
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "file")
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+
+# The SDK is only imported when tracing is on, keeping it off the startup path otherwise
+trace = None
+encode_spans = None
+if TRACING_ENABLED:
+    try:
+        from opentelemetry import propagate, trace
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import ReadableSpan, TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter, SpanExporter, SpanExportResult
+        from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+    except ImportError:
+        trace = None
+
+    try:
+        from google.protobuf import json_format
+        from opentelemetry.exporter.otlp.proto.common.trace_encoder import encode_spans
+    except ImportError:
+        encode_spans = None
+
+_tracer = trace.get_tracer("formgen") if TRACING_ENABLED and trace is not None else None
+
+
+def tracing_enabled() -> bool:
+    return _tracer is not None
+
+
+if trace is not None:
+    class FileSpanExporter(SpanExporter):
+        """
+        Appends finished spans to a local file, so traces need no collector
+
+        Each export is one line of OTLP/JSON (readable by the collector's
+        otlpjsonfile receiver) when the OTLP encoder is installed, otherwise
+        one SDK JSON document per span.
+        """
+
+        def __init__(self, path: str):
+            self._file = open(path, "a", encoding="utf-8")
+            self._lock = threading.Lock()
+
+        def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+            if encode_spans is not None:
+                lines = [json_format.MessageToJson(encode_spans(spans), indent=None)]
+            else:
+                lines = [span.to_json(indent=None) for span in spans]
+            with self._lock:
+                self._file.write("\n".join(lines) + "\n")
+                self._file.flush()
+            return SpanExportResult.SUCCESS
+
+        def shutdown(self) -> None:
+            with self._lock:
+                self._file.close()
+
+
+def setup_tracing(app) -> None:
+    """
+    Install the tracer provider and the per-request span middleware
+
+    Does nothing unless TRACING_ENABLED=true and opentelemetry-sdk is installed.
+    """
+    if TRACING_ENABLED and trace is None:
+        print("✗ TRACING_ENABLED is set but opentelemetry-sdk is not installed; tracing disabled")
+    if _tracer is None:
+        return
+
+    exporter = ConsoleSpanExporter() if TRACE_EXPORTER == "console" else FileSpanExporter(TRACE_FILE)
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": "form-creator-api"}),
+        sampler=ParentBased(TraceIdRatioBased(TRACE_SAMPLE_RATIO))
+    )
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    try:
+        # Newer FastAPI versions trace requests, dependencies and endpoints
+        # themselves once a provider is set
+        import fastapi.telemetry  # noqa: F401
+    except ImportError:
+        app.add_middleware(TracingMiddleware)
+    print(f"✓ Tracing {TRACE_SAMPLE_RATIO:.0%} of requests to {TRACE_EXPORTER}")
+
+
+def shutdown_tracing() -> None:
+    """Flush spans still buffered for export"""
+    if _tracer is not None:
+        provider = trace.get_tracer_provider()
+        if hasattr(provider, "shutdown"):
+            provider.shutdown()
+
+
+def span(name: str, attributes: Optional[Dict[str, Any]] = None):
+    """Context manager for a child span of the current one (yields None when tracing is off)"""
+    if _tracer is None:
+        return nullcontext()
+    return _tracer.start_as_current_span(name, attributes=attributes)
+
+
+def start_span(name: str, attributes: Optional[Dict[str, Any]] = None):
+    """
+    Start a span without making it current, for work that spans generator yields
+
+    The caller must end it with finish_span. Returns None when tracing is off.
+    """
+    if _tracer is None:
+        return None
+    return _tracer.start_span(name, attributes=attributes)
+
+
+def finish_span(current, attributes: Optional[Dict[str, Any]] = None, error: Optional[BaseException] = None) -> None:
+    """End a span from start_span, recording final attributes and any error"""
+    if current is None:
+        return
+    if attributes:
+        set_span_attributes(current, attributes)
+    if error is not None:
+        current.record_exception(error)
+        current.set_status(trace.Status(trace.StatusCode.ERROR, str(error)))
+    current.end()
+
+
+def set_span_attributes(current, attributes: Dict[str, Any]) -> None:
+    """Set attributes on a span if it is being recorded (None values are skipped)"""
+    if current is not None and current.is_recording():
+        current.set_attributes({key: value for key, value in attributes.items() if value is not None})
+
+
+def usage_attributes(model_name: str, usage_metadata: Any) -> Dict[str, Any]:
+    """GenAI span attributes for a Gemini response's usage"""
+    return {
+        "gen_ai.request.model": model_name,
+        "gen_ai.usage.input_tokens": getattr(usage_metadata, "prompt_token_count", None),
+        "gen_ai.usage.output_tokens": getattr(usage_metadata, "candidates_token_count", None)
+    }
+
+
+def traced(name: Optional[str] = None, attributes: Optional[Dict[str, Any]] = None) -> Callable:
+    """
+    Decorator wrapping an async function in a span
+
+    With tracing off the function is returned unchanged, so there is no
+    cost on the hot path.
+    """
+    def decorate(func):
+        if _tracer is None:
+            return func
+        span_name = name or f"{func.__module__}.{func.__name__}"
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            with _tracer.start_as_current_span(span_name, attributes=attributes):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class TracingMiddleware:
+    """
+    Root span per HTTP request, named after the matched route
+
+    Continues a trace from an incoming traceparent header when present.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        carrier = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope["headers"]}
+        method = scope["method"]
+        with _tracer.start_as_current_span(
+            f"{method} {scope['path']}",
+            context=propagate.extract(carrier),
+            kind=trace.SpanKind.SERVER,
+            attributes={"http.request.method": method, "url.path": scope["path"]}
+        ) as request_span:
+            async def send_with_status(message):
+                if message["type"] == "http.response.start":
+                    request_span.set_attribute("http.response.status_code", message["status"])
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                route = scope.get("route")
+                if route is not None and request_span.is_recording():
+                    request_span.update_name(f"{method} {route.path}")
+                    request_span.set_attribute("http.route", route.path)
@@ -45,7 +45,8 @@ export default function DashboardPage() {
 
   const fetchHistory = async () => {
     try {
-      const data = await getHistory()
+      // The recent-forms list only shows title, date and link
+      const data = await getHistory(0, 20, ["form_title", "form_url", "created_at"])
       setHistory(data)
     } catch (error) {
       console.error("Failed to fetch history:", error)
@@ -38,6 +38,19 @@ export interface FormHistoryItem {
     created_at: string;
 }
 
+// Fields the backend accepts in ?fields= (HISTORY_FIELDS in routes/history.py)
+export type HistoryField =
+    | 'form_id'
+    | 'form_url'
+    | 'form_title'
+    | 'prompt'
+    | 'created_at'
+    | 'model'
+    | 'prompt_tokens'
+    | 'output_tokens'
+    | 'cached'
+    | 'latency_ms';
+
 // ============ API Functions ============
 
 export async function getAuthUrl(): Promise<string> {
@@ -76,9 +89,9 @@ export const getStats = async (): Promise<UserStats> => {
     return response.data;
 };
 
-export async function getHistory(skip: number = 0, limit: number = 20): Promise<FormHistoryItem[]> {
+export async function getHistory(skip: number = 0, limit: number = 20, fields?: HistoryField[]): Promise<FormHistoryItem[]> {
     const response = await api.get<FormHistoryItem[]>('/api/history', {
-        params: { skip, limit },
+        params: { skip, limit, fields: fields?.join(',') },
     });
     return response.data;
 }